@@ -0,0 +1,176 @@
+import argparse
+import json
+
+import numpy as np
+
+import curve_store
+import response_cache
+import time_index
+
+# Composer's backtest `stats` block, reproduced from dvm_capital alone.
+#
+# standard_deviation is annualized: download_curves' DayStdDevPct multiplier of
+# 6.2994078834871 is exactly 100 / sqrt(252), turning it back into a daily %.
+# Ratios that would divide by zero (Calmar without a drawdown, Sharpe of a flat
+# curve) are left out, as Composer does, so stat_types' defaults apply.
+TRADING_DAYS_PER_YEAR = 252
+CALENDAR_DAYS_PER_YEAR = 365
+STD_DDOF = 1
+STAT_KEYS = [
+    "cumulative_return",
+    "annualized_rate_of_return",
+    "max_drawdown",
+    "calmar_ratio",
+    "sharpe_ratio",
+    "max",
+    "min",
+    "mean",
+    "standard_deviation",
+]
+
+# parity: |local - remote| <= ABS_TOLERANCE + REL_TOLERANCE * |remote|
+ABS_TOLERANCE = 1e-9
+REL_TOLERANCE = 1e-6
+PARITY_BATCH = 200
+
+
+def compute_stats(days, values):
+    """
+    Stats of one backtest curve given as sorted epoch days and capital values.
+    Returns {} when there are fewer than two points.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return {}
+    returns = values[1:] / values[:-1] - 1
+
+    cumulative = values[-1] / values[0] - 1
+    elapsed_days = int(days[-1]) - int(days[0])
+    annualized = (1 + cumulative) ** (CALENDAR_DAYS_PER_YEAR / elapsed_days) - 1
+    drawdown = float(np.max(1 - values / np.maximum.accumulate(values)))
+    std = float(np.std(returns, ddof=STD_DDOF)) if len(returns) > STD_DDOF else 0.0
+
+    stats = {
+        "cumulative_return": float(cumulative),
+        "annualized_rate_of_return": float(annualized),
+        "max_drawdown": drawdown,
+        "max": float(returns.max()),
+        "min": float(returns.min()),
+        "mean": float(returns.mean()),
+        "standard_deviation": float(std * np.sqrt(TRADING_DAYS_PER_YEAR)),
+    }
+    if drawdown > 0:
+        stats["calmar_ratio"] = float(annualized / drawdown)
+    if std > 0:
+        stats["sharpe_ratio"] = float(
+            returns.mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR)
+        )
+    return stats
+
+
+def window_stats(days, values, start_day, end_day):
+    """Stats of the [start_day, end_day] slice of a longer curve."""
+    lo, hi = np.searchsorted(days, [start_day, end_day + 1])
+    return compute_stats(days[lo:hi], values[lo:hi])
+
+
+def stats_from_dvm_capital(dvm_capital):
+    return compute_stats(*curve_store.curve_from_dvm_capital(dvm_capital))
+
+
+def _compare(entry, local_value, remote_value, where):
+    if remote_value is None or local_value is None:
+        if remote_value is not None:
+            entry["only_remote"] += 1
+        elif local_value is not None:
+            entry["only_local"] += 1
+        return
+    error = abs(local_value - remote_value)
+    entry["compared"] += 1
+    if error <= ABS_TOLERANCE + REL_TOLERANCE * abs(remote_value):
+        entry["matched"] += 1
+    if error > entry["max_abs_error"]:
+        entry["max_abs_error"] = error
+        entry["worst"] = where
+
+
+def parity(limit=None, curve_folder=curve_store.CURVE_FOLDER):
+    """
+    Checks what --local-stats computes against Composer: for every cached
+    backtest response, window_stats over the symphony's stored full-history
+    curve, sliced to the response's window, is compared with the response's
+    remote stats. Returns {"responses", "no_curve", "stats"}: how many responses
+    were checked, how many were skipped for want of a stored curve, and per
+    stat how many were compared, how many matched within tolerance, the worst
+    absolute error, and the remote values that were missing locally or the
+    other way round.
+    """
+    stats = {
+        key: {
+            "compared": 0,
+            "matched": 0,
+            "max_abs_error": 0.0,
+            "worst": None,
+            "only_remote": 0,
+            "only_local": 0,
+        }
+        for key in STAT_KEYS
+    }
+    report = {"responses": 0, "no_curve": 0, "stats": stats}
+    # by symphony, so each stored curve is loaded once
+    keys = sorted(
+        (symph_id, params)
+        for endpoint, symph_id, params in response_cache.entries()
+        if endpoint == "backtest"
+    )[:limit]
+
+    curve_id, curve = None, None
+    for start in range(0, len(keys), PARITY_BATCH):
+        batch = keys[start : start + PARITY_BATCH]
+        payloads = response_cache.get_many("backtest", batch)
+        for symph_id, params in batch:
+            payload = payloads.get((symph_id, params))
+            if payload is None:
+                continue
+            if symph_id != curve_id:
+                curve_id = symph_id
+                curve = curve_store.load_curve(symph_id, curve_folder)
+            if curve is None:
+                report["no_curve"] += 1
+                continue
+            start_date, end_date = params.split(":")[:2]
+            local = window_stats(
+                *curve,
+                time_index.date_to_epoch_day(start_date),
+                time_index.date_to_epoch_day(end_date),
+            )
+            remote = json.loads(payload).get("stats") or {}
+            report["responses"] += 1
+            for key, entry in stats.items():
+                _compare(entry, local.get(key), remote.get(key), f"{symph_id} {params}")
+    return report
+
+
+def parity_ok(report):
+    return report["responses"] > 0 and all(
+        entry["compared"] > 0
+        and entry["matched"] == entry["compared"]
+        and entry["only_remote"] == 0
+        and entry["only_local"] == 0
+        for entry in report["stats"].values()
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local backtest stats and their parity with Composer's"
+    )
+    parser.add_argument("command", choices=["parity"])
+    parser.add_argument("--limit", type=int, help="only check this many responses")
+    parser.add_argument("--curves", default=curve_store.CURVE_FOLDER)
+    args = parser.parse_args()
+
+    report = parity(args.limit, args.curves)
+    print(json.dumps(report, indent=2))
+    print("parity OK" if parity_ok(report) else "parity FAILED")
+    raise SystemExit(0 if parity_ok(report) else 1)
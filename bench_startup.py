@@ -0,0 +1,113 @@
+"""
+Startup benchmark for the dashboard and the pipeline entry points.
+
+    python bench_startup.py [--repeat 5] [--output bench_output.txt]
+
+Every sample runs in a fresh interpreter so nothing is already imported.
+Reports the median import time of each entry-point module, the dashboard's
+cold start (first script run, default page) and the first render of every
+other page. Needs streamlit's AppTest (streamlit >= 1.28) for the dashboard
+numbers.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = [
+    "download_curves",
+    "cache_manager",
+    "tearsheet",
+    "simple_screener",
+    "correlation",
+]
+# non-default dashboard pages; the default one is part of the cold start
+PAGES = ["Advanced Explorer", "Single ID QuantStat", "Correlation"]
+
+IMPORT_SCRIPT = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+APP_SCRIPT = """
+import json
+import time
+from streamlit.testing.v1 import AppTest
+
+started = time.perf_counter()
+app = AppTest.from_file("dashboard.py", default_timeout=300)
+app.run()
+cold_start = time.perf_counter() - started
+
+first_render = None
+if {page!r}:
+    started = time.perf_counter()
+    app.sidebar.radio[0].set_value({page!r}).run()
+    first_render = time.perf_counter() - started
+print(json.dumps([cold_start, first_render]))
+"""
+
+
+def run_sample(script):
+    """Runs script in a fresh interpreter; returns its last stdout line or raises."""
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ["failed"])[-1]
+        raise RuntimeError(error)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def median_of(samples):
+    return statistics.median(samples) if samples else None
+
+
+def bench(repeat):
+    results = {}
+    for module in ENTRY_POINTS:
+        try:
+            samples = [
+                float(run_sample(IMPORT_SCRIPT.format(module=module)))
+                for _ in range(repeat)
+            ]
+            results[f"import {module}"] = median_of(samples)
+        except RuntimeError as e:
+            results[f"import {module}"] = f"error: {e}"
+
+    for page in [None] + PAGES:
+        name = "dashboard cold start" if page is None else f"first render: {page}"
+        try:
+            samples = [
+                json.loads(run_sample(APP_SCRIPT.format(page=page)))
+                for _ in range(repeat)
+            ]
+            index = 0 if page is None else 1
+            results[name] = median_of([sample[index] for sample in samples])
+        except RuntimeError as e:
+            results[name] = f"error: {e}"
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="bench_output.txt")
+    args = parser.parse_args()
+
+    results = bench(args.repeat)
+    lines = [
+        (
+            f"{name:<40} {value:8.3f} s"
+            if isinstance(value, float)
+            else f"{name:<40} {value}"
+        )
+        for name, value in results.items()
+    ]
+    with open(args.output, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
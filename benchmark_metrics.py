@@ -0,0 +1,80 @@
+import backtest_stats
+import numpy as np
+import pandas as pd
+
+# Market-relative stats of every symphony against each benchmark, for the
+# trailing eras of the returns matrix (each a suffix of it, as in
+# returns_matrix.era_correlations). Every stat of every symphony comes from a few
+# vector products of the era's returns with the benchmark's, so one era of the
+# whole universe is one pass over the matrix.
+#
+#   Beta                 cov(symphony, benchmark) / var(benchmark)
+#   AlphaAnnualizedPct   (mean daily return - beta * benchmark's) * 252, in %
+#   UpCapturePct         mean return on the benchmark's up days / benchmark's, in %
+#   DownCapturePct       the same over the benchmark's down days
+#   Corr                 correlation of the daily returns
+BENCHMARK_TICKERS = ["SPY", "QQQ"]
+METRICS = ["Beta", "AlphaAnnualizedPct", "UpCapturePct", "DownCapturePct", "Corr"]
+
+
+def column_name(metric, ticker, description):
+    return f"{metric}{ticker}_BeforeToday_{description}"
+
+
+def era_metrics(matrix, benchmark, days):
+    """
+    {metric: values over every symphony} for one benchmark returns vector on
+    the matrix grid and the era of `days` days. Symphonies whose data starts
+    inside the era get NaN.
+    """
+    returns = matrix["returns"]
+    end_day = matrix["end_day"]
+    cut = int(np.searchsorted(matrix["days"][:-1], end_day - days))
+    count = len(returns) - cut
+    if count < 2:
+        return {metric: np.full(returns.shape[1], np.nan) for metric in METRICS}
+
+    segment = returns[cut:]
+    # in the matrix's own dtype, so a float32 map is never copied to float64
+    b = benchmark[cut:].astype(segment.dtype)
+    ones = np.ones(count, segment.dtype)
+    mean = ones @ segment / count
+    centered_b = b - b.mean()
+    cov = centered_b @ segment / (count - 1)
+    var_b = centered_b @ centered_b / (count - 1)
+    var = (np.einsum("ij,ij->j", segment, segment) - count * mean**2) / (count - 1)
+    up = (b > 0).astype(segment.dtype)
+    down = (b < 0).astype(segment.dtype)
+
+    # an era without up (or down) days leaves that capture NaN, without warnings
+    with np.errstate(divide="ignore", invalid="ignore"):
+        up_mean = up @ segment / up.sum()
+        down_mean = down @ segment / down.sum()
+        beta = cov / var_b
+        alpha = (mean - beta * b.mean()) * backtest_stats.TRADING_DAYS_PER_YEAR
+        metrics = {
+            "Beta": beta,
+            "AlphaAnnualizedPct": alpha * 100,
+            "UpCapturePct": up_mean / (up @ b / up.sum()) * 100,
+            "DownCapturePct": down_mean / (down @ b / down.sum()) * 100,
+            "Corr": cov / np.sqrt(np.clip(var, 0, None) * var_b),
+        }
+    ineligible = matrix["start_days"] > end_day - days
+    for metric, values in metrics.items():
+        values = np.asarray(values, dtype=np.float64)
+        values[~np.isfinite(values) | ineligible] = np.nan
+        metrics[metric] = values
+    return metrics
+
+
+def benchmark_table(matrix, benchmarks, eras):
+    """
+    One row per symphony of the matrix, one column per (metric, benchmark, era).
+    benchmarks: {ticker: returns on the matrix grid}; eras: [(days, description)].
+    """
+    columns = {}
+    for ticker, benchmark in benchmarks.items():
+        for days, description in eras:
+            for metric, values in era_metrics(matrix, benchmark, days).items():
+                columns[column_name(metric, ticker, description)] = values
+    return pd.DataFrame({"id": matrix["ids"], **columns})
@@ -0,0 +1,237 @@
+import argparse
+import datetime
+import json
+import os
+import re
+import time
+
+import response_cache
+
+# the file-per-response cache folders the response cache replaced, and the
+# endpoint each one's responses are indexed under
+LEGACY_FOLDERS = {
+    "backtest_results": "backtest",
+    "live_start_dates": "live_start_date",
+    "symphony_scores": "score",
+}
+# endpoints whose params are just the day the response was fetched
+DATED_ENDPOINTS = ["live_start_date", "score", "score_features"]
+# endpoints nothing reads any more: full score texts, replaced by score_features
+RETIRED_ENDPOINTS = ["score"]
+FULL_HISTORY_START = "1990-01-01"
+IMPORT_BATCH = 500
+
+# limits used by `gc` when none are given on the command line; None = unbounded
+DEFAULT_MAX_BYTES = None
+DEFAULT_MAX_AGE_DAYS = None
+
+# 2_<id>-<start>-to-<end>.json, <id>-live_start_date-<date>.json, <id>-score-<date>.json
+BACKTEST_RE = re.compile(
+    r"^2_(?P<id>.+)-(?P<start>\d{4}-\d{2}-\d{2})-to-(?P<end>\d{4}-\d{2}-\d{2})\.json$"
+)
+DATED_RE = re.compile(
+    r"^(?P<id>.+)-(?P<kind>live_start_date|score)-(?P<date>\d{4}-\d{2}-\d{2})\.json$"
+)
+
+
+def backtest_params(start_date, end_date, benchmark_tickers=()):
+    """start:end, plus :TICKER,TICKER when benchmark curves were requested too."""
+    params = f"{start_date}:{end_date}"
+    if benchmark_tickers:
+        params += ":" + ",".join(benchmark_tickers)
+    return params
+
+
+def _legacy_key(file_name):
+    backtest = BACKTEST_RE.match(file_name)
+    if backtest:
+        return backtest["id"], backtest_params(backtest["start"], backtest["end"])
+    dated = DATED_RE.match(file_name)
+    if dated:
+        return dated["id"], dated["date"]
+    return None
+
+
+def import_legacy(folder_name):
+    """
+    Moves the files of an old file-per-response cache folder (flat or ID-prefix
+    layout) into the response cache, keeping their fetch times, and removes the
+    folder once it is empty. Files another process imports (and removes) first
+    are skipped.
+    """
+    endpoint = LEGACY_FOLDERS[folder_name]
+    imported = 0
+    if not os.path.exists(folder_name):
+        return imported
+
+    batch, stored_at, paths = {}, {}, []
+
+    def flush():
+        response_cache.put_many(endpoint, batch, stored_at)
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        batch.clear()
+        stored_at.clear()
+        paths.clear()
+
+    for dir_path, _, file_names in os.walk(folder_name):
+        for file_name in file_names:
+            key = _legacy_key(file_name)
+            if key is None:
+                continue
+            path = os.path.join(dir_path, file_name)
+            try:
+                with open(path, "rb") as file:
+                    batch[key] = file.read()
+                stored_at[key] = os.path.getmtime(path)
+            except FileNotFoundError:
+                batch.pop(key, None)
+                continue
+            paths.append(path)
+            imported += 1
+            if len(batch) >= IMPORT_BATCH:
+                flush()
+    if batch:
+        flush()
+
+    manifest = os.path.join(folder_name, "manifest.json")
+    if os.path.exists(manifest):
+        try:
+            os.remove(manifest)
+        except FileNotFoundError:
+            pass
+    for dir_path, _, _ in sorted(os.walk(folder_name), reverse=True):
+        try:
+            os.rmdir(dir_path)
+        except OSError:
+            pass  # something we did not recognise is still in there
+    return imported
+
+
+def superseded_entries(entries, today=None):
+    """
+    Entries a newer response has replaced, plus which full-history curves to protect.
+
+    Date-stamped metadata (live start dates, score features): all but the newest
+    per id. Entries of retired endpoints (full score texts) are all superseded.
+    Backtests requested up to their own fetch day ("to today" windows) are
+    superseded once that day has passed, except that the newest full-history
+    (1990-to-date) curve per symphony is always kept. Historical windows that
+    ended before they were fetched never change and are kept.
+    """
+    today = today or datetime.date.today().isoformat()
+    superseded = set()
+    protected = set()
+    newest_dated = {}
+    newest_full_history = {}
+
+    for key, info in entries.items():
+        endpoint, symph_id, params = key
+        if endpoint in RETIRED_ENDPOINTS:
+            superseded.add(key)
+            continue
+        if endpoint in DATED_ENDPOINTS:
+            newest_dated.setdefault((endpoint, symph_id), []).append((params, key))
+            continue
+        if endpoint != "backtest":
+            continue
+        start, end = params.split(":")[:2]
+        if start == FULL_HISTORY_START:
+            newest_full_history.setdefault(symph_id, []).append((end, key))
+        created = datetime.date.fromtimestamp(info["stored"]).isoformat()
+        if created <= end < today:
+            superseded.add(key)
+
+    for versions in newest_dated.values():
+        versions.sort()
+        superseded.update(key for _, key in versions[:-1])
+    for versions in newest_full_history.values():
+        versions.sort()
+        protected.add(versions[-1][1])
+        superseded.discard(versions[-1][1])
+    return superseded, protected
+
+
+def gc(max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS, dry_run=False):
+    """
+    Drops superseded responses, then anything not accessed within max_age_days,
+    then least-recently-used responses until the cache fits in max_bytes, and
+    compacts the segment files. The newest full-history curve per symphony is
+    only evicted as a last resort.
+    """
+    if not dry_run:
+        for folder_name in LEGACY_FOLDERS:
+            import_legacy(folder_name)
+
+    entries = response_cache.entries()
+    superseded, protected = superseded_entries(entries)
+    doomed = set(superseded)
+
+    if max_age_days is not None:
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        doomed.update(
+            key
+            for key, info in entries.items()
+            if info["accessed"] < cutoff and key not in protected
+        )
+
+    if max_bytes is not None:
+        remaining = sum(
+            info["size"] for key, info in entries.items() if key not in doomed
+        )
+        # least recently used first, protected curves after everything else
+        candidates = sorted(
+            (key for key in entries if key not in doomed),
+            key=lambda key: (key in protected, entries[key]["accessed"]),
+        )
+        for key in candidates:
+            if remaining <= max_bytes:
+                break
+            doomed.add(key)
+            remaining -= entries[key]["size"]
+
+    report = {}
+    for key in entries:
+        endpoint_report = report.setdefault(
+            key[0], {"files_removed": 0, "bytes_freed": 0, "files_kept": 0}
+        )
+        if key in doomed:
+            endpoint_report["files_removed"] += 1
+            endpoint_report["bytes_freed"] += entries[key]["size"]
+        else:
+            endpoint_report["files_kept"] += 1
+
+    if not dry_run and entries:
+        response_cache.delete(doomed)
+        response_cache.compact()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache garbage collection")
+    parser.add_argument("command", choices=["gc", "import"])
+    parser.add_argument("--max-gb", type=float, help="size limit for the cache")
+    parser.add_argument(
+        "--max-age-days", type=float, help="drop entries not accessed for this long"
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(
+            json.dumps(
+                {folder: import_legacy(folder) for folder in LEGACY_FOLDERS}, indent=2
+            )
+        )
+    else:
+        max_bytes = DEFAULT_MAX_BYTES
+        if args.max_gb is not None:
+            max_bytes = int(args.max_gb * 1024**3)
+        max_age_days = args.max_age_days
+        if max_age_days is None:
+            max_age_days = DEFAULT_MAX_AGE_DAYS
+
+        print(json.dumps(gc(max_bytes, max_age_days, args.dry_run), indent=2))
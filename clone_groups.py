@@ -0,0 +1,118 @@
+import numpy as np
+import os
+import pandas as pd
+import returns_matrix
+
+# Copies and trivial edits of the same strategy have (near) identical return
+# series. Exact copies share a hash of their quantized returns; near copies
+# share SimHash bits -- the signs of random projections of their standardized
+# returns, whose Hamming distance tracks the angle between the series. LSH over
+# bands of those bits proposes candidate pairs in roughly linear time, and each
+# candidate is confirmed with its exact correlation before it is merged.
+# Series that never move (flat or all-zero returns) have no shape to copy: they
+# would all hash alike and all correlate at 0/0, so they are left ungrouped.
+CLONE_GROUPS_PATH = "clone_groups.csv"
+SIMHASH_BITS = 64
+BAND_BITS = 8
+CLONE_MIN_CORR = 0.995
+QUANTUM = 1e-6
+# candidates per bucket beyond which a bucket is just common structure, not clones
+MAX_BUCKET = 2000
+SEED = 0
+
+
+def simhash(returns, bits=SIMHASH_BITS, seed=SEED):
+    """One uint64 signature per column of a (days x symphonies) returns matrix."""
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((bits, returns.shape[0]))
+    signs = (planes @ returns_matrix.standardize(returns)) > 0
+    weights = np.left_shift(np.uint64(1), np.arange(bits, dtype=np.uint64))
+    return (signs.astype(np.uint64) * weights[:, None]).sum(axis=0, dtype=np.uint64)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _union(parent, i, j):
+    root_i, root_j = _find(parent, i), _find(parent, j)
+    if root_i != root_j:
+        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def find_clone_groups(ids, returns, priority=None, min_corr=CLONE_MIN_CORR):
+    """
+    Groups near-duplicate return series.
+
+    ids label the columns of returns (days x symphonies). priority ranks who
+    represents a group (lower wins, e.g. the first day of data, so the original
+    beats later copies); it defaults to column order. Returns a DataFrame with
+    one row per id: its group's representative and the group's size. Columns
+    with zero variance each stay a group of their own.
+    """
+    n = len(ids)
+    parent = np.arange(n)
+    varying = np.flatnonzero(np.ptp(returns, axis=0) > 0)
+    returns = returns[:, varying]
+
+    # exact copies: identical quantized returns
+    quantized = np.round(returns / QUANTUM).astype(np.int64)
+    exact = {}
+    for k, j in enumerate(varying):
+        key = quantized[:, k].tobytes()
+        if key in exact:
+            _union(parent, exact[key], j)
+        else:
+            exact[key] = j
+
+    # near copies: LSH over SimHash bands, confirmed by correlation
+    unit = returns_matrix.standardize(returns)
+    signatures = simhash(returns)
+    mask = np.uint64((1 << BAND_BITS) - 1)
+    for band in range(SIMHASH_BITS // BAND_BITS):
+        keys = (signatures >> np.uint64(band * BAND_BITS)) & mask
+        order = np.argsort(keys, kind="stable")
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for bucket in np.split(order, bounds):
+            if len(bucket) < 2 or len(bucket) > MAX_BUCKET:
+                continue
+            roots = np.array([_find(parent, j) for j in varying[bucket]])
+            # one member per group already formed is enough to test against
+            bucket = bucket[np.unique(roots, return_index=True)[1]]
+            if len(bucket) < 2:
+                continue
+            corr = unit[:, bucket].T @ unit[:, bucket]
+            for a, b in zip(*np.nonzero(np.triu(corr >= min_corr, k=1))):
+                _union(parent, varying[bucket[a]], varying[bucket[b]])
+
+    roots = np.array([_find(parent, j) for j in range(n)], dtype=np.int64)
+    rank = np.arange(n) if priority is None else np.asarray(priority)
+    representative = {}
+    for j in np.lexsort((np.arange(n), rank)):
+        representative.setdefault(roots[j], j)
+    sizes = np.bincount(roots, minlength=n)
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "clone_of": [ids[representative[root]] for root in roots],
+            "group_size": sizes[roots],
+        }
+    )
+
+
+def save_clone_groups(groups, path=CLONE_GROUPS_PATH):
+    groups.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def load_clone_groups(path=CLONE_GROUPS_PATH):
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path)
+
+
+def representatives(groups):
+    return groups.loc[groups["id"] == groups["clone_of"], "id"]
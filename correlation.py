@@ -1,8 +1,11 @@
+import fetch_service
+import matrix_store
 import numpy as np
-import os
 import pandas as pd
+import returns_matrix
 import streamlit as st
 import uuid
+from download_curves import era, get_full_curve, latest_market_day_int
 from st_aggrid import AgGrid, GridOptionsBuilder
 from tearsheet import generate_12mo_plot
 
@@ -105,28 +108,52 @@ def create_custom_df_column(unique_id):
     return f"{selected_category}_{selected_era}_{selected_interval}"
 
 
-def find_csvs_with_id(user_id):
-    # Define a unique key for storing the result based on the user_id
-    session_key = f"filtered_intervals_{user_id}"
-
-    # Check if the result is already memoized in st.session_state
-    if session_key in st.session_state:
-        return st.session_state[session_key]
-
-    filtered_intervals = []
-    for interval in intervals:
-        file_name = f"correlation_matrix_{interval}.csv"
-        if os.path.exists(file_name):
-            df = pd.read_csv(file_name)
-            # Assuming the first column should be renamed to "id"
-            df.rename(columns={df.columns[0]: "id"}, inplace=True)
-            if user_id in df.columns:
-                filtered_intervals.append(interval)
-
-    # Store the result in st.session_state before returning it
-    st.session_state[session_key] = filtered_intervals
-
-    return filtered_intervals
+@st.cache_data(max_entries=256, show_spinner=False)
+def symphony_returns(symph_id, market_day, version):
+    """
+    (returns on the matrix grid, first epoch day of data) for symph_id.
+    Symphonies missing from the matrix (e.g. added since the nightly run) have
+    their one curve loaded, or fetched, and aligned on the matrix grid. Raises
+    LookupError when that fetch fails, so the failure is not cached.
+    """
+    # the version the cache is keyed on, even if a newer one was published since
+    matrix = matrix_store.attach(version)
+    try:
+        column = np.flatnonzero(matrix["ids"] == symph_id)
+        if len(column):
+            return (
+                np.array(matrix["returns"][:, column[0]]),
+                int(matrix["start_days"][column[0]]),
+            )
+
+        curve = get_full_curve(symph_id, priority=fetch_service.INTERACTIVE)
+        if curve is None:
+            raise LookupError(f"no curve for {symph_id}")
+        days, values = curve
+        return returns_matrix.curve_returns(matrix, days, values), int(days[0])
+    finally:
+        matrix_store.release(matrix)
+
+
+def intervals_with_data(symph_id, market_day, version):
+    found = symphony_returns(symph_id, market_day, version)
+    matrix = matrix_store.attach(version)
+    end_day = matrix["end_day"]
+    matrix_store.release(matrix)
+    return [name for days, name in era if found[1] <= end_day - days]
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def correlation_row(symph_id, interval, market_day, version):
+    """symph_id's correlation with every symphony in the matrix over one era."""
+    returns, _ = symphony_returns(symph_id, market_day, version)
+    days = {name: days for days, name in era}[interval]
+    matrix = matrix_store.attach(version)
+    try:
+        row = returns_matrix.correlation_row(matrix, returns, days)
+    finally:
+        matrix_store.release(matrix)
+    return pd.DataFrame({"id": row.index.astype(str), symph_id: row.to_numpy()})
 
 
 ## PAGE STREAMLIT START ##
@@ -139,7 +166,19 @@ def correlation_page():
     if not user_algo_id:  # Proceed only if the user has entered an ID
         return
 
-    filtered_intervals = find_csvs_with_id(user_algo_id)
+    # mapped once per process and shared by every session; version keys the caches
+    matrix = matrix_store.current()
+    if matrix is None:
+        st.write("No returns matrix yet: run download_curves compute-corr first")
+        return
+    version = matrix["version"]
+    market_day = int(latest_market_day_int())
+
+    try:
+        filtered_intervals = intervals_with_data(user_algo_id, market_day, version)
+    except LookupError:
+        st.write("No returns available for this ID right now; try again later")
+        return
     if not filtered_intervals:
         st.write("No correlations for known time intervals")
         return
@@ -148,20 +187,7 @@ def correlation_page():
     st.write("## 2. Here are the known correlation intervals for this ID. Choose one:")
     selected_interval = st.selectbox("", filtered_intervals)
 
-    # Load the corresponding CSV file
-    file_name = f"correlation_matrix_{selected_interval}.csv"
-    corr_df = pd.read_csv(file_name)
-    corr_df.rename(columns={corr_df.columns[0]: "id"}, inplace=True)
-    corr_df["id"] = corr_df["id"].astype(str)
-
-    # Filter the DataFrame to keep only the "id" column and the column corresponding to the user_algo_id
-    if user_algo_id in corr_df.columns:
-        corr_df = corr_df[["id", user_algo_id]]
-    else:
-        st.write(
-            "An error occurred. The selected time-interval does not contain the entered ID."
-        )
-        return
+    corr_df = correlation_row(user_algo_id, selected_interval, market_day, version)
 
     st.write(
         "## 3. OPTIONAL: Filter down database (e.g.: only keep algos with high gains):"
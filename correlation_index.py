@@ -0,0 +1,228 @@
+import argparse
+import matrix_store
+import numpy as np
+import os
+import pandas as pd
+import returns_matrix
+
+# Answers "who is most / least correlated with X" without an N x N matrix.
+#
+# Each symphony's standardized 12-month returns are projected to SKETCH_DIMS
+# Gaussian random directions; dot products of sketches estimate correlations.
+# The sketches are clustered on the unit sphere (k-means, about
+# LISTS_PER_ROOT * sqrt(N) lists). A query scores the list centroids, reads the
+# PROBES best lists (sublinear), ranks those candidates by sketch dot product
+# and re-ranks the best RERANK_FACTOR * k exactly against the returns matrix.
+# The most negatively correlated series sit close to -X, so a "least" query
+# probes the lists whose centroids score lowest.
+#
+# Probing more lists or re-ranking more candidates trades latency for recall;
+# `exhaustive` ranks every sketch and is the recall ceiling of the sketches.
+INDEX_PATH = "correlation_index.npz"
+SKETCH_DIMS = 128
+LISTS_PER_ROOT = 2
+PROBES = 32
+RERANK_FACTOR = 50
+KMEANS_ITERATIONS = 8
+# a new window moves the sketches a little; the old centroids are a good start
+WARM_ITERATIONS = 2
+SEED = 0
+
+
+def _projection(days):
+    """One random direction per return, keyed by its day so windows can share them."""
+    return np.stack(
+        [
+            np.random.default_rng([SEED, int(day)]).standard_normal(SKETCH_DIMS)
+            for day in days[:-1]
+        ],
+        axis=1,
+    ) / np.sqrt(SKETCH_DIMS)
+
+
+def sketch(returns, days):
+    """float32 sketches (symphonies x SKETCH_DIMS) of a returns matrix on grid `days`."""
+    projection = _projection(days)
+    return (projection @ returns_matrix.standardize(returns)).T.astype(np.float32)
+
+
+def _unit(sketches):
+    norms = np.linalg.norm(sketches, axis=1, keepdims=True)
+    return np.divide(sketches, norms, out=np.zeros_like(sketches), where=norms > 0)
+
+
+def _assign(sketches, centroids):
+    return np.argmax(_unit(sketches) @ centroids.T, axis=1).astype(np.int32)
+
+
+def _kmeans(sketches, centroids, iterations):
+    """Spherical k-means; a list left empty keeps its previous centroid."""
+    points = _unit(sketches)
+    for _ in range(iterations):
+        lists = np.argmax(points @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, lists, points)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centroids)
+    return centroids.astype(np.float32)
+
+
+def _initial_centroids(sketches):
+    count = max(1, min(len(sketches), int(LISTS_PER_ROOT * np.sqrt(len(sketches)))))
+    rng = np.random.default_rng(SEED)
+    return _unit(sketches[rng.choice(len(sketches), count, replace=False)])
+
+
+def _with_lists(index):
+    """Adds the positions sorted by list and where each list starts."""
+    lists = index["lists"]
+    index["list_order"] = np.argsort(lists, kind="stable").astype(np.int32)
+    index["list_starts"] = np.searchsorted(
+        lists[index["list_order"]], np.arange(len(index["centroids"]) + 1)
+    )
+    return index
+
+
+def build_index(matrix, centroids=None):
+    """
+    Indexes every column of a returns matrix, in matrix order. Given the
+    centroids of an earlier index they are refined instead of trained afresh.
+    """
+    sketches = sketch(matrix["returns"], matrix["days"])
+    if len(sketches) == 0:
+        centroids = np.zeros((0, SKETCH_DIMS), np.float32)
+    elif centroids is None or len(centroids) == 0:
+        centroids = _kmeans(sketches, _initial_centroids(sketches), KMEANS_ITERATIONS)
+    else:
+        centroids = _kmeans(sketches, centroids, WARM_ITERATIONS)
+    return _with_lists(
+        {
+            "ids": matrix["ids"],
+            "end_day": matrix["end_day"],
+            "days": matrix["days"],
+            "sketches": sketches,
+            "centroids": centroids,
+            "lists": (
+                _assign(sketches, centroids) if len(sketches) else np.zeros(0, np.int32)
+            ),
+        }
+    )
+
+
+def update_index(index, matrix):
+    """
+    Brings an index in line with a returns matrix. While the matrix covers the
+    same days, only symphonies new to it are sketched and assigned to the
+    nearest list; a new window re-sketches everything and refines the lists.
+    """
+    if index is None or len(index["centroids"]) == 0:
+        return build_index(matrix)
+    if index["end_day"] != matrix["end_day"] or not np.array_equal(
+        index["days"], matrix["days"]
+    ):
+        return build_index(matrix, index["centroids"])
+
+    old = pd.Series(np.arange(len(index["ids"])), index=index["ids"])
+    positions = old.reindex(matrix["ids"]).to_numpy()
+    new = np.isnan(positions)
+    kept = positions[~new].astype(int)
+
+    sketches = np.empty((len(matrix["ids"]), SKETCH_DIMS), np.float32)
+    lists = np.empty(len(matrix["ids"]), np.int32)
+    sketches[~new] = index["sketches"][kept]
+    lists[~new] = index["lists"][kept]
+    if new.any():
+        sketches[new] = sketch(matrix["returns"][:, new], matrix["days"])
+        lists[new] = _assign(sketches[new], index["centroids"])
+    return _with_lists(
+        {
+            "ids": matrix["ids"],
+            "end_day": index["end_day"],
+            "days": index["days"],
+            "sketches": sketches,
+            "centroids": index["centroids"],
+            "lists": lists,
+        }
+    )
+
+
+def save_index(index, path=INDEX_PATH):
+    np.savez(path + ".tmp.npz", **index)
+    os.replace(path + ".tmp.npz", path)
+
+
+def load_index(path=INDEX_PATH):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        index = {key: data[key] for key in data.files}
+    index["end_day"] = int(index["end_day"])
+    return index
+
+
+def candidates(index, position, most=True, probes=PROBES):
+    """Positions in the lists whose centroids best match the query (or its negation)."""
+    sign = 1 if most else -1
+    scores = sign * (index["centroids"] @ index["sketches"][position])
+    probed = np.argsort(-scores, kind="stable")[:probes]
+    order = index["list_order"]
+    starts = index["list_starts"]
+    found = np.concatenate([order[starts[i] : starts[i + 1]] for i in probed])
+    return found[found != position]
+
+
+def query(index, matrix, symph_id, k=20, most=True, exhaustive=False):
+    """
+    The k symphonies most (or, with most=False, least) correlated with symph_id
+    over the matrix window, as a Series of exact correlations in rank order.
+    exhaustive=True ranks every symphony by sketch instead of probing lists.
+    The index must have been updated against this matrix. Returns None when
+    symph_id is not in it.
+    """
+    if not np.array_equal(index["ids"], matrix["ids"]):
+        raise ValueError("correlation index is out of date with the returns matrix")
+    positions = np.flatnonzero(index["ids"] == symph_id)
+    if len(positions) == 0:
+        return None
+    position = int(positions[0])
+    if exhaustive:
+        pool = np.delete(np.arange(len(index["ids"])), position)
+    else:
+        pool = candidates(index, position, most)
+
+    sign = 1 if most else -1
+    estimate = sign * (index["sketches"][pool] @ index["sketches"][position])
+    shortlist = pool[np.argsort(-estimate, kind="stable")[: RERANK_FACTOR * k]]
+
+    unit = returns_matrix.standardize(matrix["returns"][:, [position, *shortlist]])
+    exact = pd.Series(unit[:, 1:].T @ unit[:, 0], index=index["ids"][shortlist])
+    return exact.sort_values(ascending=not most).head(k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Approximate correlation search")
+    parser.add_argument("command", choices=["query"])
+    parser.add_argument("id")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument(
+        "--least", action="store_true", help="most negatively correlated"
+    )
+    parser.add_argument("--exhaustive", action="store_true")
+    args = parser.parse_args()
+
+    matrix = matrix_store.attach()
+    try:
+        result = query(
+            load_index(),
+            matrix,
+            args.id,
+            args.k,
+            most=not args.least,
+            exhaustive=args.exhaustive,
+        )
+    finally:
+        matrix_store.release(matrix)
+    if result is None:
+        print(f"{args.id} is not in the correlation index")
+    else:
+        print(result.to_string())
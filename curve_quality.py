@@ -0,0 +1,250 @@
+import numpy as np
+import os
+import pandas as pd
+
+# Data-quality checks over every cached curve at once, run before the stats and
+# correlations so a broken series never reaches them. All curves are laid end
+# to end in one array and every check is a vectorized pass over it, with
+# per-curve results gathered by bincount / reduceat over the curve boundaries.
+#
+# The market calendar is the curves' own consensus: a day is a market day when
+# at least CALENDAR_QUORUM of the curves spanning it have a close on it.
+#
+# Repaired (the repaired curve replaces the cached one):
+#   bad_values   NaN, infinite, zero or negative capital: the last good close
+#                is carried forward; leading bad closes are dropped
+#   spikes       a jump reverted the next day: the close takes its neighbour's
+# Excluded:
+#   too_short    fewer than two good closes
+#   stale        stops more than MAX_STALE_DAYS market days before the latest
+#                one (a day of API lag is only flagged, in stale_days)
+#   flat         no move over the last FLAT_TAIL_DAYS closes
+#   gap          more than MAX_GAP_DAYS market days missing in a row
+#   jump         a one-day move of more than MAX_DAILY_MOVE times, either way
+# Flagged only: missing and off-calendar days, the gap histogram, and outliers
+# (moves over OUTLIER_Z standard deviations and MIN_JUMP).
+CURVE_QUALITY_PATH = "curve_quality.csv"
+CALENDAR_QUORUM = 0.5
+FLAT_TAIL_DAYS = 20
+MAX_STALE_DAYS = 1
+MAX_GAP_DAYS = 5
+MAX_DAILY_MOVE = 10
+OUTLIER_Z = 8
+MIN_JUMP = 0.25
+# a spike's next move takes back all but this fraction of it
+SPIKE_REVERT = 0.1
+# gap histogram buckets: runs of 1, 2-5 and 6+ missing market days
+GAP_BUCKETS = {"gaps_1": 1, "gaps_2_5": 2, "gaps_6_plus": 6}
+FLAG_COLUMNS = [
+    "points",
+    "missing_days",
+    "longest_gap",
+    *GAP_BUCKETS,
+    "off_calendar_days",
+    "stale_days",
+    "flat_tail",
+    "bad_values",
+    "spikes",
+    "outliers",
+]
+
+
+def market_calendar(days, starts, ends, market_day=None):
+    """
+    Epoch days, up to market_day if given, that at least CALENDAR_QUORUM of the
+    curves spanning them have.
+    """
+    low, high = days.min(), days.max()
+    counts = np.bincount(days - low, minlength=high - low + 1)
+    spanning = np.zeros(high - low + 2, np.int64)
+    np.add.at(spanning, days[starts] - low, 1)
+    np.add.at(spanning, days[ends] - low + 1, -1)
+    spanning = np.cumsum(spanning[:-1])
+    calendar = low + np.flatnonzero(
+        (counts > 0) & (counts >= CALENDAR_QUORUM * spanning)
+    )
+    return calendar if market_day is None else calendar[calendar <= market_day]
+
+
+def _calendar_positions(calendar, days):
+    """
+    (market days before each day, whether it is one), by table lookup over the
+    span of the days rather than a binary search per close.
+    """
+    low = min(days.min(), calendar.min(initial=days.min()))
+    high = max(days.max(), calendar.max(initial=days.max()))
+    is_market_day = np.zeros(high - low + 1, dtype=bool)
+    is_market_day[calendar - low] = True
+    before = np.cumsum(is_market_day) - is_market_day
+    return before[days - low], is_market_day[days - low]
+
+
+def _repair_values(values, segment, starts):
+    """(values with bad closes carried forward, bad positions, leading mask)."""
+    bad = np.flatnonzero(~np.isfinite(values) | (values <= 0))
+    if len(bad) == 0:
+        return values, bad, None
+    good = np.ones(len(values), dtype=bool)
+    good[bad] = False
+    last_good = np.maximum.accumulate(np.where(good, np.arange(len(values)), -1))
+    leading = last_good < starts[segment]
+    fill = bad[~leading[bad]]
+    values = values.copy()
+    values[fill] = values[last_good[fill]]
+    return values, bad, leading
+
+
+def _per_curve(segment, positions, curves):
+    """How many of positions fall in each curve."""
+    return np.bincount(segment[positions], minlength=curves).astype(np.int64)
+
+
+def validate_curves(curves, market_day=None):
+    """
+    curves: {id: (days, values)} as in the curve store; market_day: the latest
+    market day, so a curve running past it cannot make the rest look stale
+    (default: the calendar's last day). Returns (flags, repaired):
+    one row of FLAG_COLUMNS, status ("ok", "repaired" or "excluded") and reason
+    per id, and {id: (days, values)} of the repaired curves that are kept.
+    """
+    ids = list(curves)
+    n = len(ids)
+    lengths = np.array([len(curves[i][0]) for i in ids], np.int64)
+    days = np.concatenate(
+        [np.asarray(curves[i][0], np.int64) for i in ids] or [np.empty(0, np.int64)]
+    )
+    values = np.concatenate(
+        [np.asarray(curves[i][1], np.float64) for i in ids] or [np.empty(0)]
+    )
+    segment = np.repeat(np.arange(n), lengths)
+    starts = np.cumsum(lengths) - lengths
+
+    values, bad, leading = _repair_values(values, segment, starts)
+    flags = pd.DataFrame(0, index=pd.Index(ids, name="id"), columns=FLAG_COLUMNS)
+    flags["bad_values"] = _per_curve(segment, bad, n)
+    good_closes = lengths
+    if leading is not None:
+        good_closes = lengths - _per_curve(segment, np.flatnonzero(leading), n)
+    reasons = {"too_short": good_closes < 2}
+
+    # the remaining checks only see curves with two or more good closes
+    rows = np.flatnonzero(~reasons["too_short"])
+    if len(rows) == 0:
+        return _finish(flags, reasons, {}, ids)
+    if len(rows) < n or leading is not None:
+        keep = ~reasons["too_short"][segment]
+        if leading is not None:
+            keep &= ~leading
+        days, values = days[keep], values[keep]
+        lengths = good_closes[rows]
+        segment = np.repeat(np.arange(len(rows)), lengths)
+        starts = np.cumsum(lengths) - lengths
+    ends = starts + lengths - 1
+
+    calendar = market_calendar(days, starts, ends, market_day)
+    before, on_calendar = _calendar_positions(calendar, days)
+    # market days strictly between each close and the one before it
+    between = np.zeros(len(days), np.int64)
+    between[1:] = before[1:] - (before[:-1] + on_calendar[:-1])
+    between[starts] = 0
+    gaps = np.flatnonzero(between > 0)
+    bucket = np.digitize(between[gaps], list(GAP_BUCKETS.values())) - 1
+    histogram = np.zeros((len(rows), len(GAP_BUCKETS)), np.int64)
+    np.add.at(histogram, (segment[gaps], bucket), 1)
+    on_count = np.add.reduceat(on_calendar, starts).astype(np.int64)
+
+    moves = np.zeros(len(values))
+    moves[1:] = np.log(values[1:] / values[:-1])
+    moves[starts] = 0
+    # only the few big moves need a closer look
+    limit = np.log1p(MIN_JUMP)
+    jumps = np.flatnonzero(np.abs(moves) > limit)
+    following = moves[np.minimum(jumps + 1, len(moves) - 1)]
+    following[np.isin(jumps, ends)] = 0
+    spikes = jumps[
+        (np.abs(following) > limit)
+        & (np.abs(moves[jumps] + following) < SPIKE_REVERT * np.abs(moves[jumps]))
+    ]
+    values[spikes] = values[spikes - 1]
+    for position in [spikes, spikes + 1]:
+        position = position[~np.isin(position, starts)]
+        moves[position] = np.log(values[position] / values[position - 1])
+
+    count = lengths - 1
+    mean = np.add.reduceat(moves, starts) / count
+    square = np.add.reduceat(moves * moves, starts) / count
+    std = np.sqrt(np.clip(square - mean**2, 0, None))
+    jumps = np.flatnonzero(np.abs(moves) > limit)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.abs(moves[jumps] - mean[segment[jumps]]) / std[segment[jumps]]
+    outliers = jumps[z > OUTLIER_Z]
+    absurd = jumps[np.abs(moves[jumps]) > np.log(MAX_DAILY_MOVE)]
+
+    # the last close that moved, or the curve's first if none did
+    moved = np.concatenate([[-1], np.flatnonzero(moves)])
+    last_moved = moved[np.searchsorted(moved, ends, side="right") - 1]
+    last_moved = np.maximum(last_moved, starts)
+
+    checked = {
+        "points": lengths,
+        "missing_days": before[ends] + on_calendar[ends] - before[starts] - on_count,
+        "longest_gap": np.maximum.reduceat(between, starts),
+        **{name: histogram[:, k] for k, name in enumerate(GAP_BUCKETS)},
+        "off_calendar_days": lengths - on_count,
+        "stale_days": len(calendar) - (before[ends] + on_calendar[ends]),
+        "flat_tail": ends - last_moved,
+        "spikes": _per_curve(segment, spikes, len(rows)),
+        "outliers": _per_curve(segment, outliers, len(rows)),
+    }
+    for name, column in checked.items():
+        flags.iloc[rows, flags.columns.get_loc(name)] = column.astype(np.int64)
+    for name, failed in [
+        ("stale", checked["stale_days"] > MAX_STALE_DAYS),
+        ("flat", checked["flat_tail"] >= FLAT_TAIL_DAYS),
+        ("gap", checked["longest_gap"] > MAX_GAP_DAYS),
+        ("jump", _per_curve(segment, absurd, len(rows)) > 0),
+    ]:
+        reasons[name] = np.zeros(n, dtype=bool)
+        reasons[name][rows] = failed
+
+    excluded = np.logical_or.reduce(list(reasons.values()))
+    changed = (flags["bad_values"].to_numpy() > 0) | (flags["spikes"].to_numpy() > 0)
+    repaired = {}
+    for k, row in enumerate(rows):
+        if changed[row] and not excluded[row]:
+            span = slice(starts[k], ends[k] + 1)
+            repaired[ids[row]] = days[span].astype(np.int32), values[span]
+    return _finish(flags, reasons, repaired, ids)
+
+
+def _finish(flags, reasons, repaired, ids):
+    excluded = np.logical_or.reduce(list(reasons.values()))
+    flags["status"] = np.where(
+        excluded,
+        "excluded",
+        np.where(flags.index.isin(list(repaired)), "repaired", "ok"),
+    )
+    flags["reason"] = [
+        ";".join(name for name, failed in reasons.items() if failed[row])
+        for row in range(len(ids))
+    ]
+    return flags.reset_index(), repaired
+
+
+def save_flags(flags, path=CURVE_QUALITY_PATH):
+    flags.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def load_flags(path=CURVE_QUALITY_PATH):
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, keep_default_na=False)
+
+
+def keep_valid(df, flags):
+    """df without the rows of excluded curves (all of df if nothing was checked)."""
+    if flags is None:
+        return df
+    excluded = flags.loc[flags["status"] == "excluded", "id"]
+    return df[~df["id"].isin(excluded)].reset_index(drop=True)
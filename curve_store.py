@@ -0,0 +1,43 @@
+import numpy as np
+import os
+import tempfile
+
+# one compact .npz per symphony holding its full-history daily capital curve
+CURVE_FOLDER = "curves"
+
+
+def curve_path(symph_id, folder=CURVE_FOLDER):
+    return os.path.join(folder, f"{symph_id}.npz")
+
+
+def curve_from_dvm_capital(dvm_capital):
+    """Converts a raw {"epoch_day": capital} dict into (days, values) arrays sorted by day."""
+    days = np.fromiter(
+        (int(k) for k in dvm_capital.keys()), dtype=np.int32, count=len(dvm_capital)
+    )
+    values = np.fromiter(dvm_capital.values(), dtype=np.float64, count=len(dvm_capital))
+    # keys are strings -- sort numerically, not lexically
+    order = np.argsort(days, kind="stable")
+    return days[order], values[order]
+
+
+def save_curve(symph_id, days, values, folder=CURVE_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    # write to a temp file first so concurrent readers never see a partial curve
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            np.savez(file, days=days, values=values)
+        os.replace(tmp_path, curve_path(symph_id, folder))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_curve(symph_id, folder=CURVE_FOLDER):
+    path = curve_path(symph_id, folder)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return data["days"], data["values"]
@@ -1,10 +1,6 @@
+import importlib
 import pandas as pd
-from pygwalker.api.streamlit import StreamlitRenderer, init_streamlit_comm
 import streamlit as st
-import streamlit.components.v1 as components
-from simple_screener import simple_screener_page
-from tearsheet import single_tearsheet
-from correlation import correlation_page
 
 st.set_page_config(layout="wide")
 
@@ -17,14 +13,31 @@ hide_settings_menu = """
 st.markdown(hide_settings_menu, unsafe_allow_html=True)
 
 
+def lazy_page(module_name, function_name):
+    """
+    A page whose module -- and with it the module's heavy dependencies -- is only
+    imported the first time the page is selected, not at app startup.
+    """
+
+    def page():
+        getattr(importlib.import_module(module_name), function_name)()
+
+    return page
+
+
 def data_explorer_page():
+    from pygwalker.api.streamlit import init_streamlit_comm
+
     st.write("Advanced Explorer page. It may take a second to load...")
+    init_streamlit_comm()
     renderer = get_pyg_renderer()
     renderer.render_explore()
 
 
 @st.cache_data
 def get_pyg_renderer() -> "StreamlitRenderer":
+    from pygwalker.api.streamlit import StreamlitRenderer
+
     df = pd.read_csv(
         "./output.csv",
         na_values=[
@@ -46,13 +59,11 @@ def get_pyg_renderer() -> "StreamlitRenderer":
     )
 
 
-init_streamlit_comm()
-
 PAGES = {
-    "Simple Selector": simple_screener_page,
+    "Simple Selector": lazy_page("simple_screener", "simple_screener_page"),
     "Advanced Explorer": data_explorer_page,
-    "Single ID QuantStat": single_tearsheet,
-    "Correlation": correlation_page,
+    "Single ID QuantStat": lazy_page("tearsheet", "single_tearsheet"),
+    "Correlation": lazy_page("correlation", "correlation_page"),
 }
 
 selection = st.sidebar.radio("Navigation:", list(PAGES.keys()))
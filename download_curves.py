@@ -1,15 +1,39 @@
+import argparse
+import backtest_stats
+import benchmark_metrics
+import cache_manager
+import clone_groups
+import correlation_index
 import csv
+import curve_quality
+import curve_store
 import datetime
+import fetch_service
+import hashlib
 import inspect
+import itertools
 import json
+import live_decay
+import matrix_store
+import negative_cache
 import numpy as np
 import os
 import pandas as pd
-import pytz
 import requests
+import response_cache
+import returns_matrix
+import score_features
+import shutil
+import strategy_clusters
+import subprocess
+import sys
+import rolling_stats
+import run_metrics
+import scheduler
+import snapshot_store
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time_index
 
 # names -- must be kept in this order
 era_prefixes = [
@@ -25,16 +49,57 @@ era = [
     (365, "12mo"),
 ]
 period_final = "13moToMax"
+# the eras whose windows run up to today, so their stats move every day
+to_today_eras = ["AfterLive", "BeforeToday"]
 delta_days_13mo = 395
 
-DATE_1990 = "1990-01-01"  # 11110
+# output column prefix -> (stat key in the backtest response, default, multiplier)
+stat_types = {
+    "GainTotalPct": ("cumulative_return", 0, 100),
+    "GainAnnualizedPct": ("annualized_rate_of_return", 0, 100),
+    "DrawdownMaxPct": ("max_drawdown", 0, 100),
+    "Calmar": ("calmar_ratio", 100000, 1),
+    "Sharpe": ("sharpe_ratio", 100, 1),
+    "DayBestPct": ("max", 0, 100),
+    "DayWorstPct": ("min", 0, 100),
+    "DayAvgPct": ("mean", 0, 100),
+    "DayStdDevPct": ("standard_deviation", 0, 6.2994078834871),
+}
+first_columns = ["id", "algo_size", "algo_start_date", "algo_live_date"]
+
+DATE_1990 = "1990-01-01"
+DAY_1990 = time_index.date_to_epoch_day(DATE_1990)  # 7305
 DATE_TODAY = datetime.date.today()
-DATE_TWO_WEEKS_AGO = (datetime.date.today() - datetime.timedelta(weeks=2)).strftime(
-    "%Y-%m-%d"
-)
+DAY_TODAY = time_index.date_to_epoch_day(DATE_TODAY)
+SHARD_FOLDER = "shards"
+UNIVERSE_PATH = "aa_total_symphs.csv"
+METADATA_PATH = "symphs_metadata.csv"
+OUTPUT_PATH = "output.csv"
+CORR_PATH = "correlation_matrix_{era}.csv"
+STAGES = [
+    "fetch-metadata",
+    "fetch-curves",
+    "validate-curves",
+    "compute-stats",
+    "compute-corr",
+    "cluster",
+    "benchmark",
+    "build-indexes",
+    "snapshot",
+]
 XOM_SYMPH_ID = "cv9jhez5EhhG00KHDlly"
-DELISTED_SYMPH_ID = "Do36TWTu1gWh8SewO1Go"
+# score payloads are parsed as they stream in, this many bytes at a time
+SCORE_CHUNK_BYTES = 64 * 1024
+# seconds to wait on a remote call before giving up on (and retrying) it
+REQUEST_TIMEOUT_S = 120
 last_call_time = None
+# thread pool size for every fetch/compute stage; None = ThreadPoolExecutor default
+max_workers = None
+# compute the era stats from the curve store (backtest_stats) instead of one
+# remote backtest per window; only switch on once `backtest_stats.py parity` passes
+local_stats = False
+# correlate one symphony per clone group (see clone_groups) instead of all of them
+representatives_only = False
 
 dir_creation_lock = threading.Lock()
 
@@ -70,7 +135,7 @@ def v_print(*args, **kwargs):
 
 
 def epoch_days_to_date(days: int) -> datetime.date:
-    return datetime.datetime.fromtimestamp(days * 24 * 60 * 60, tz=pytz.UTC).date()
+    return time_index.epoch_day_to_date(days)
 
 
 def ensure_folder_exists(folder_name):
@@ -82,35 +147,53 @@ def ensure_folder_exists(folder_name):
                 os.makedirs(folder_name)
 
 
-def single_backtest(symph_id, start_date, end_date, max_retries=1, use_stored=True):
-    if isinstance(start_date, str):
-        start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-    if isinstance(end_date, str):
-        end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d")
-
-    start_date = start_date.strftime("%Y-%m-%d")
-    end_date = end_date.strftime("%Y-%m-%d")
+def backtest_dates(start_date, end_date):
+    """Normalises backtest window bounds (epoch days, strings or dates) to YYYY-MM-DD."""
+    dates = []
+    for date in (start_date, end_date):
+        # dates may also be given as int epoch days
+        if isinstance(date, (int, np.integer)):
+            date = time_index.epoch_day_to_date(date)
+        if isinstance(date, str):
+            date = datetime.datetime.strptime(date, "%Y-%m-%d")
+        dates.append(date.strftime("%Y-%m-%d"))
+    return tuple(dates)
+
+
+def single_backtest(
+    symph_id,
+    start_date,
+    end_date,
+    max_retries=1,
+    use_stored=True,
+    priority=fetch_service.BATCH,
+    benchmark_tickers=(),
+):
+    """
+    The backtest JSON of symph_id over [start_date, end_date]; dvm_capital also
+    holds a curve per benchmark ticker asked for.
+    """
+    start_date, end_date = backtest_dates(start_date, end_date)
 
     v_print(f"backtest: {symph_id}: {start_date}-to-{end_date}")
-    file_name = f"2_{symph_id}-{start_date}-to-{end_date}.json"
-    folder_name = "backtest_results"
-
-    ensure_folder_exists(folder_name)
-
-    # Construct the full file path
-    file_path = os.path.join(folder_name, file_name)
+    params = cache_manager.backtest_params(start_date, end_date, benchmark_tickers)
 
     try:
-        # Check if the results file already exists
-        if os.path.exists(file_path) and use_stored:
-            v_print(f"Reading from existing file {file_name}")
-            with open(file_path, "r") as file:
-                return json.load(file)
+        payload = (
+            response_cache.get("backtest", symph_id, params) if use_stored else None
+        )
+        if payload is not None:
+            run_metrics.record_cache("backtest_results", hit=True)
+            run_metrics.record_parsed(len(payload))
+            return json.loads(payload)
     except Exception as e:
         v_print(f"An error occurred while reading from cache: {e}")
+    run_metrics.record_cache("backtest_results", hit=False)
 
     data = (
-        '["^ ","~:benchmark_symphonies",[],"~:benchmark_tickers",[],"~:backtest_version","v2","~:apply_reg_fee",true,"~:apply_taf_fee",true,"~:slippage_percent",0.0005,"~:start_date","'
+        '["^ ","~:benchmark_symphonies",[],"~:benchmark_tickers",'
+        + json.dumps(list(benchmark_tickers), separators=(",", ":"))
+        + ',"~:backtest_version","v2","~:apply_reg_fee",true,"~:apply_taf_fee",true,"~:slippage_percent",0.0005,"~:start_date","'
         + str(start_date)
         + '","~:capital",10000,"~:end_date","'
         + str(end_date)
@@ -127,16 +210,28 @@ def single_backtest(symph_id, start_date, end_date, max_retries=1, use_stored=Tr
     retries = 0
     while retries < max_retries:
         retries += 1
+        response = None
+        request_started = time.perf_counter()
         try:
-            response = requests.post(url, headers=headers, data=data)
+            fetch_service.acquire(priority)
+            response = requests.post(
+                url, headers=headers, data=data, timeout=REQUEST_TIMEOUT_S
+            )
+            run_metrics.record_request("backtest", request_started, response)
             response.raise_for_status()
-            # Cache the result to disk
-            with open(file_path, "w") as file:
-                json.dump(response.json(), file)
-                v_print(f"Result saved to disk {file_name}")
-            return response.json()
+            result = response.json()
+            run_metrics.record_parsed(len(response.content))
+            response_cache.put("backtest", symph_id, params, response.content)
+            return result
         except requests.exceptions.RequestException as e:
+            if response is None:
+                run_metrics.record_request("backtest", request_started, error=e)
             v_print(f"Error executing backtest for id {symph_id}: {e}")
+            if response is not None and response.status_code == 404:
+                # a dashboard lookup of a mistyped id must not hide it from the crawl
+                if priority == fetch_service.BATCH:
+                    negative_cache.record(symph_id, "not_found", "backtest 404")
+                break
             if retries < max_retries:
                 v_print(f"Retrying... Attempt {retries}/{max_retries}")
                 time.sleep(1)  # Add a small delay before retrying
@@ -149,41 +244,72 @@ def single_backtest(symph_id, start_date, end_date, max_retries=1, use_stored=Tr
             )
             break
 
-    v_print(f"error at {file_name}")
+    v_print(f"error at {symph_id}: {start_date}-to-{end_date}")
+    # the dashboard may retry at will; only the batch crawl backs off
+    if priority == fetch_service.BATCH and negative_cache.skip_reason(symph_id) is None:
+        negative_cache.record(symph_id, "failed", f"{start_date}-to-{end_date}")
     return None
 
 
-def get_live_start_date(symphony_id, max_retries=1, retry_delay=2):
-    # Get today's date in YYYY-MM-DD format
-    # Define the file and folder names based on the symphony_id and today's date
-    today = DATE_TODAY.strftime("%Y-%m-%d")
-    file_name = f"{symphony_id}-live_start_date-{today}.json"
-    folder_name = "live_start_dates"
+def multiple_window_backtests(symph_id, windows):
+    """
+    Backtests of one symphony over several (start, end) windows: all cached
+    windows come from a single index query, only the misses go out remotely.
+    Returns {window: json result or None}.
+    """
+    params = {
+        window: cache_manager.backtest_params(*backtest_dates(*window))
+        for window in windows
+    }
+    try:
+        cached = response_cache.get_many(
+            "backtest",
+            [(symph_id, window_params) for window_params in params.values()],
+        )
+    except Exception as e:
+        # as in single_backtest: an unreadable cache means fetching everything
+        v_print(f"An error occurred while reading from cache: {e}")
+        cached = {}
+    results = {}
+    for window, window_params in params.items():
+        payload = cached.get((symph_id, window_params))
+        if payload is None:
+            results[window] = single_backtest(symph_id, *window, use_stored=False)
+            continue
+        run_metrics.record_cache("backtest_results", hit=True)
+        run_metrics.record_parsed(len(payload))
+        results[window] = json.loads(payload)
+    return results
 
-    ensure_folder_exists(folder_name)
 
-    # Construct the full file path
-    file_path = os.path.join(folder_name, file_name)
+def get_live_start_date(
+    symphony_id, max_retries=1, retry_delay=2, priority=fetch_service.BATCH
+):
+    # responses are cached per symphony per day (YYYY-MM-DD)
+    today = DATE_TODAY.strftime("%Y-%m-%d")
 
-    # Check if the results file already exists
-    if os.path.exists(file_path):
-        v_print(f"Reading from existing file {file_name}")
-        with open(file_path, "r") as file:
-            data = json.load(file)
-            # Check if 'last_semantic_update_at' key exists
-            if "fields" in data and "last_semantic_update_at" in data["fields"]:
-                return data["fields"]["last_semantic_update_at"][
-                    "timestampValue"
-                ].split("T")[0]
-            else:
-                v_print(
-                    f"'last_semantic_update_at' key not found in the file {file_name}."
-                )
-                return None
+    payload = response_cache.get("live_start_date", symphony_id, today)
+    if payload is not None:
+        run_metrics.record_cache("live_start_dates", hit=True)
+        data = json.loads(payload)
+        # Check if 'last_semantic_update_at' key exists
+        if "fields" in data and "last_semantic_update_at" in data["fields"]:
+            return data["fields"]["last_semantic_update_at"]["timestampValue"].split(
+                "T"
+            )[0]
+        else:
+            v_print(
+                f"'last_semantic_update_at' key not found in the cached response for {symphony_id}."
+            )
+            return None
+
+    run_metrics.record_cache("live_start_dates", hit=False)
 
     retries = 0
     while retries < max_retries:
         retries += 1
+        response = None
+        request_started = time.perf_counter()
         try:
             url = (
                 "https://firestore.googleapis.com/v1/projects/leverheads-278521/databases/(default)/documents/symphony/"
@@ -195,19 +321,19 @@ def get_live_start_date(symphony_id, max_retries=1, retry_delay=2):
                 "Content-Type": "application/json",
             }
 
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT_S)
+            run_metrics.record_request("firestore", request_started, response)
             if response.status_code == 403:  # Check for 403 Forbidden status code
                 v_print(
                     f"Access denied with 403 Forbidden error for symphony {symphony_id}."
                 )
+                if priority == fetch_service.BATCH:
+                    negative_cache.record(symphony_id, "forbidden", "firestore 403")
                 return None  # Return immediately if 403 error encountered
             response.raise_for_status()
             data = response.json()
 
-            # Save the response to disk
-            with open(file_path, "w") as file:
-                json.dump(data, file)
-                v_print(f"Saved response to {file_path}")
+            response_cache.put("live_start_date", symphony_id, today, response.content)
 
             if "fields" in data and "last_semantic_update_at" in data["fields"]:
                 return data["fields"]["last_semantic_update_at"][
@@ -218,6 +344,8 @@ def get_live_start_date(symphony_id, max_retries=1, retry_delay=2):
                 return None
 
         except requests.exceptions.RequestException as e:
+            if response is None:
+                run_metrics.record_request("firestore", request_started, error=e)
             v_print(f"Error getting live start date for symphony {symphony_id}: {e}")
             if retries < max_retries:
                 v_print("Retrying...")
@@ -242,45 +370,40 @@ def get_symphony_list(file_path):
 
 def download_multiple_backtests(symphony_ids, start_date, end_date):
     """
-    Downloads backtest data using a ThreadPoolExecutor.
+    Downloads backtest data using a thread pool.
     """
-    with ThreadPoolExecutor() as executor:
-        # Create a future to symphony_id mapping by submitting tasks directly using single_backtest
-        future_to_symph_id = {
-            executor.submit(single_backtest, symph_id, start_date, end_date): symph_id
-            for symph_id in symphony_ids
-        }
-
-        for future in as_completed(future_to_symph_id):
-            symph_id = future_to_symph_id[future]
+    with run_metrics.InstrumentedExecutor(
+        "download_multiple_backtests", max_workers
+    ) as executor:
+        for symph_id, future in scheduler.stream_map(
+            executor,
+            lambda symph_id: single_backtest(symph_id, start_date, end_date),
+            symphony_ids,
+            scheduler.in_flight_limit(max_workers),
+        ):
             try:
-                result = (
-                    future.result()
-                )  # No need to unpack a tuple, as we're directly getting the result
+                future.result()
                 v_print(f"Completed backtest for {symph_id}")
             except Exception as exc:
                 v_print(f"{symph_id} generated an exception: {exc}")
 
 
-def get_size_of_symphony(symphony_id):
-    v_print(f"get size: {symphony_id}")
+def get_score_features(symphony_id):
+    """
+    score_features of the symphony's current score, streamed from the API and
+    parsed as it arrives; only the features are cached, not the score text.
+    """
+    v_print(f"get score features: {symphony_id}")
     today = DATE_TODAY.strftime("%Y-%m-%d")
 
-    file_name = f"{symphony_id}-score-{today}.json"
-    folder_name = "symphony_scores"
-
-    ensure_folder_exists(folder_name)
-
-    # Construct the full file path
-    file_path = os.path.join(folder_name, file_name)
-
-    # Check if the file already exists
-    if os.path.exists(file_path):
-        v_print(f"Reading from existing file {file_name}")
-        with open(file_path, "r") as file:
-            data = file.read()
-            return len(data)
+    payload = response_cache.get("score_features", symphony_id, today)
+    if payload is not None:
+        run_metrics.record_cache("symphony_scores", hit=True)
+        return json.loads(payload)
+    run_metrics.record_cache("symphony_scores", hit=False)
 
+    response = None
+    request_started = time.perf_counter()
     try:
         url = (
             "https://backtest-api.composer.trade/api/v1/public/symphonies/"
@@ -288,276 +411,822 @@ def get_size_of_symphony(symphony_id):
             + "/score?score_version=v2"
         )
 
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.text
-
-        # Save the response to disk
-        with open(file_path, "w") as file:
-            file.write(data)
-            v_print(f"Saved response to {file_path}")
+        fetch_service.acquire(fetch_service.BATCH)
+        with requests.get(url, stream=True, timeout=REQUEST_TIMEOUT_S) as response:
+            if response.status_code >= 400:
+                run_metrics.record_request("score", request_started, response)
+                response.raise_for_status()
+            features = score_features.parse_score(
+                response.iter_content(chunk_size=SCORE_CHUNK_BYTES)
+            )
+        run_metrics.record_request(
+            "score", request_started, response, size=features["size"]
+        )
+        run_metrics.record_parsed(features["size"])
 
-        return len(data)
+        response_cache.put(
+            "score_features", symphony_id, today, json.dumps(features).encode()
+        )
+        return features
     except requests.exceptions.RequestException as e:
-        v_print(f"Error getting size of symphony {symphony_id}: {e}")
+        if response is None or response.status_code < 400:
+            # no response, or the body broke off mid-stream
+            run_metrics.record_request("score", request_started, error=e)
+        v_print(f"Error getting score of symphony {symphony_id}: {e}")
         return None
     except Exception as e:
         v_print(
-            f"An unexpected error occurred in get_size_of_symphony for symphony {symphony_id}: {e}"
+            f"An unexpected error occurred in get_score_features for symphony {symphony_id}: {e}"
         )
         return None
 
 
 def latest_market_day_int():
-    if not hasattr(latest_market_day_int, "last_market_day"):
+    # memoized per calendar day, not per process: the dashboard server outlives
+    # the day it was started on
+    today = datetime.date.today()
+    if getattr(latest_market_day_int, "date", None) != today:
         curve = single_backtest(
-            XOM_SYMPH_ID, DATE_TWO_WEEKS_AGO, DATE_TODAY.strftime("%Y-%m-%d")
+            XOM_SYMPH_ID,
+            (today - datetime.timedelta(weeks=2)).strftime("%Y-%m-%d"),
+            today.strftime("%Y-%m-%d"),
         )
-        curve = dict(sorted(curve["dvm_capital"][XOM_SYMPH_ID].items()))
-        latest_market_day_int.last_market_day = list(curve.keys())[-1]
+        days, _ = curve_store.curve_from_dvm_capital(curve["dvm_capital"][XOM_SYMPH_ID])
+        latest_market_day_int.last_market_day = int(days[-1])
+        latest_market_day_int.date = today
     return latest_market_day_int.last_market_day
 
 
-def find_min_date_int(sym_id):
-    full_curve = single_backtest(sym_id, DATE_1990, DATE_TODAY.strftime("%Y-%m-%d"))
+def get_full_curve(
+    sym_id,
+    use_stored=True,
+    curve_folder=curve_store.CURVE_FOLDER,
+    priority=fetch_service.BATCH,
+):
+    """Returns the full-history (days, values) curve, refreshing the curve store when stale."""
+    market_day = latest_market_day_int()
+    if use_stored:
+        curve = curve_store.load_curve(sym_id, curve_folder)
+        if curve is not None and curve[0][-1] >= market_day:
+            run_metrics.record_cache("curves", hit=True)
+            return curve
+    run_metrics.record_cache("curves", hit=False)
+
+    # today's date rather than DATE_TODAY, which is fixed when the module loads
+    full_curve = single_backtest(
+        sym_id,
+        DATE_1990,
+        datetime.date.today().strftime("%Y-%m-%d"),
+        priority=priority,
+    )
     if full_curve is None:
+        return None
+    days, values = curve_store.curve_from_dvm_capital(full_curve["dvm_capital"][sym_id])
+    if len(days) == 0:
+        return None
+    curve_store.save_curve(sym_id, days, values, curve_folder)
+    return days, values
+
+
+def find_min_date_int(sym_id, curve_folder=curve_store.CURVE_FOLDER):
+    curve = get_full_curve(sym_id, curve_folder=curve_folder)
+    if curve is None:
         v_print(f"No data returned for symphony ID {sym_id}")
+        if negative_cache.skip_reason(sym_id) is None:
+            negative_cache.record(sym_id, "no_data")
         return None
-    curve = dict(sorted(full_curve["dvm_capital"][sym_id].items()))
-    min_date = list(curve.keys())[0]
-    max_date = list(curve.keys())[-1]
+    days, _ = curve
+    min_date = int(days[0])
+    max_date = int(days[-1])
     if latest_market_day_int() == max_date:
-        return int(min_date) + 1
+        return min_date + 1
     else:
         # since max date is not valid -- we wont use this symph
         v_print(f"Max Date: {max_date}, Latest Market Day: {latest_market_day_int()}")
+        negative_cache.record(
+            sym_id, "stale", f"last day {epoch_days_to_date(max_date)}"
+        )
         return None
 
 
-def get_symph_dates():
-    symphony_ids = get_symphony_list("aa_total_symphs.csv")
-    df = pd.DataFrame(symphony_ids, columns=["id"])
+def parse_shard(shard_spec):
+    """Parses an "i/N" shard spec (0-based i) into (shard_index, shard_count)."""
+    shard_index, shard_count = (int(part) for part in shard_spec.split("/"))
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"invalid shard {shard_spec}, expected i/N with 0 <= i < N")
+    return shard_index, shard_count
+
+
+def shard_of(symph_id, shard_count):
+    # stable across machines and runs, unlike the salted built-in hash()
+    digest = hashlib.sha1(symph_id.encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) % shard_count
+
+
+def shard_folder(shard_index, shard_count):
+    return os.path.join(SHARD_FOLDER, f"shard-{shard_index}-of-{shard_count}")
 
-    df.loc[:, "algo_size"] = None
-    df.loc[:, "algo_start_date"] = None
-    df.loc[:, "algo_live_date"] = None
+
+def get_symph_dates(
+    shard=None,
+    curve_folder=curve_store.CURVE_FOLDER,
+    universe_path=UNIVERSE_PATH,
+    features=None,
+):
+    """Metadata rows of the (shard's) universe; fills features, if given, by id."""
+    symphony_ids = get_symphony_list(universe_path)
+    if shard is not None:
+        shard_index, shard_count = shard
+        symphony_ids = [
+            symph_id
+            for symph_id in symphony_ids
+            if shard_of(symph_id, shard_count) == shard_index
+        ]
+    universe_order = {symph_id: i for i, symph_id in enumerate(symphony_ids)}
+
+    # known-dead ids cost no request and no thread time until they are due again
+    symphony_ids, skipped = negative_cache.split_due(symphony_ids)
+    for reason in set(skipped.values()):
+        count = sum(1 for skip in skipped.values() if skip == reason)
+        v_print(f"Skipping {count} symphonies ({reason}) until their recheck day")
+    for symph_id in universe_order:
+        run_metrics.record_cache("negative", hit=symph_id in skipped)
 
     # df = df.head(100)
 
-    def process_row1(row):
-        symphony_id = row.id
+    def process_row1(symphony_id):
         live_start_date = get_live_start_date(symphony_id)
         if live_start_date is None:
             return None
 
-        min_date = find_min_date_int(symphony_id)
+        min_date = find_min_date_int(symphony_id, curve_folder)
         if min_date is None:
             return None
 
-        row_dict = row._asdict()
-        row_dict["algo_live_date"] = live_start_date
-        row_dict["algo_start_date"] = epoch_days_to_date(min_date)
-        row_dict["algo_size"] = get_size_of_symphony(symphony_id)
-        return row_dict
+        negative_cache.clear(symphony_id)
+        score = get_score_features(symphony_id)
+        if score is not None and features is not None:
+            features[symphony_id] = score
+        return {
+            "id": symphony_id,
+            "algo_size": None if score is None else score["size"],
+            "algo_start_date": epoch_days_to_date(min_date),
+            "algo_live_date": live_start_date,
+        }
 
-    with ThreadPoolExecutor() as executor:
-        for index, row in enumerate(
-            executor.map(process_row1, df.itertuples(index=False))
+    rows = []
+    with run_metrics.InstrumentedExecutor("get_symph_dates", max_workers) as executor:
+        for _, future in scheduler.stream_map(
+            executor, process_row1, symphony_ids, scheduler.in_flight_limit(max_workers)
         ):
+            row = future.result()
             if row is not None:
-                df.at[index, "algo_size"] = row["algo_size"]
-                df.at[index, "algo_start_date"] = row["algo_start_date"]
-                df.at[index, "algo_live_date"] = row["algo_live_date"]
+                rows.append(row)
 
-    df = df.dropna(subset=["algo_live_date"])
-    df = df.dropna(subset=["algo_start_date"])
-    return df
+    # completion order is arbitrary; keep the universe file's order
+    rows.sort(key=lambda row: universe_order[row["id"]])
+    return pd.DataFrame(rows, columns=first_columns)
 
 
 def get_era_dates(era, data_begin, live_date, delta_days, isBeyondDelta=False):
+    # all dates are int epoch days, so windowing is plain integer arithmetic
     bt_start = None
     bt_end = None
     if era == era_prefixes[0]:  # AfterLive
-        era_date_mark = live_date + datetime.timedelta(days=delta_days)
+        era_date_mark = live_date + delta_days
         # assumes algos are pre-filtered and running live today
-        if era_date_mark <= DATE_TODAY:
+        if era_date_mark <= DAY_TODAY:
             # max AFTER is valid
             bt_start = live_date
             bt_end = era_date_mark
             if isBeyondDelta:
-                bt_end = DATE_TODAY
+                bt_end = DAY_TODAY
     elif era == era_prefixes[1]:  # BeforeLive
-        era_date_mark = live_date - datetime.timedelta(days=delta_days)
+        era_date_mark = live_date - delta_days
         if era_date_mark >= data_begin:
             # max BEFORE is valid
             bt_start = era_date_mark
             bt_end = live_date
             if isBeyondDelta:
-                bt_start = DATE_1990
+                bt_start = DAY_1990
     elif era == era_prefixes[2]:  # BeforeToday
-        era_date_mark = DATE_TODAY - datetime.timedelta(days=delta_days)
+        era_date_mark = DAY_TODAY - delta_days
         # assumes algos are pre-filtered and running live today
         if era_date_mark >= data_begin:
             # max AFTER is valid
             bt_start = era_date_mark
-            bt_end = DATE_TODAY
+            bt_end = DAY_TODAY
             if isBeyondDelta:
-                bt_start = DATE_1990
+                bt_start = DAY_1990
     else:
         v_print("UNKNOWN ENUM")
 
     return bt_start, bt_end
 
 
-def process_row(row):
+def stat_columns():
+    """Names of every column process_row fills in."""
+    return [
+        f"{stat_name}_{era_prefix}_{description}"
+        for era_prefix in era_prefixes
+        for stat_name in stat_types
+        for description in [period_final] + [description for _, description in era]
+    ]
 
-    stat_types = {
-        "GainTotalPct": ("cumulative_return", 0, 100),
-        "GainAnnualizedPct": ("annualized_rate_of_return", 0, 100),
-        "DrawdownMaxPct": ("max_drawdown", 0, 100),
-        "Calmar": ("calmar_ratio", 100000, 1),
-        "Sharpe": ("sharpe_ratio", 100, 1),
-        "DayBestPct": ("max", 0, 100),
-        "DayWorstPct": ("min", 0, 100),
-        "DayAvgPct": ("mean", 0, 100),
-        "DayStdDevPct": ("standard_deviation", 0, 6.2994078834871),
-    }
+
+def process_row(row, curve_folder=curve_store.CURVE_FOLDER, eras=era_prefixes):
 
     results = {}
     results[row["id"]] = row["id"]
 
     # dates
-    live_date = pd.to_datetime(row["algo_live_date"]).date()
-    start_date = pd.to_datetime(row["algo_start_date"]).date()
+    live_date = time_index.date_to_epoch_day(row["algo_live_date"])
+    start_date = time_index.date_to_epoch_day(row["algo_start_date"])
+
+    # the window of every (era_prefix, description) column; all stats of a
+    # window come from the same backtest
+    windows = {}
+    for era_prefix in eras:
+        # get stat for period_final first, as this is a max
+        windows[era_prefix, period_final] = get_era_dates(
+            era_prefix, start_date, live_date, delta_days_13mo, True
+        )
+        # get stats for rest of the eras
+        for days, description in era:
+            windows[era_prefix, description] = get_era_dates(
+                era_prefix, start_date, live_date, days
+            )
+
+    needed = [
+        window
+        for window in dict.fromkeys(windows.values())
+        if window[0] is not None and window[1] is not None
+    ]
+    if local_stats:
+        curve = get_full_curve(row["id"], curve_folder=curve_folder)
+        backtests = {}
+        if curve is not None:
+            backtests = {
+                window: {"stats": backtest_stats.window_stats(*curve, *window)}
+                for window in needed
+            }
+    else:
+        backtests = multiple_window_backtests(row["id"], needed)
 
-    for era_prefix in era_prefixes:
-        bt_start = None
-        bt_end = None
+    for (era_prefix, description), window in windows.items():
+        json_result = backtests.get(window)
         # Iterate through each stat type and get stats
         for stat_name, stat_tuple in stat_types.items():
             stat_json_name, default_value, multiplier = stat_tuple
-
-            # get stat for period_final first, as this is a max
-            results_key = f"{stat_name}_{era_prefix}_{period_final}"
+            results_key = f"{stat_name}_{era_prefix}_{description}"
             results[results_key] = None
-            bt_start, bt_end = get_era_dates(
-                era_prefix, start_date, live_date, delta_days_13mo, True
-            )
-            if bt_start is not None and bt_end is not None:
-                json_result = single_backtest(row["id"], bt_start, bt_end)
-                if json_result is not None:  # Check if json_result is not None
-                    results[results_key] = (
-                        json_result["stats"].get(stat_json_name, default_value)
-                        * multiplier
-                    )
-                else:
-                    results[results_key] = None  # Or handle the None case appropriately
-
-            # get stats for rest of the eras
-            for days, description in era:
-                results_key = f"{stat_name}_{era_prefix}_{description}"
-                results[results_key] = None
-                bt_start, bt_end = get_era_dates(
-                    era_prefix, start_date, live_date, days
+            if json_result is not None:
+                results[results_key] = (
+                    json_result["stats"].get(stat_json_name, default_value) * multiplier
                 )
-                if bt_start is not None and bt_end is not None:
-                    json_result = single_backtest(row["id"], bt_start, bt_end)
-                    if json_result is not None:  # Check if json_result is not None
-                        results[results_key] = (
-                            json_result["stats"].get(stat_json_name, default_value)
-                            * multiplier
-                        )
-                    else:
-                        results[results_key] = (
-                            None  # Or handle the None case appropriately
-                        )
 
     return results
 
 
-def before_live(df):
-    with ThreadPoolExecutor() as executor:
-        all_results = []
-        all_results.extend(
-            executor.map(lambda row: process_row(row), df.to_dict("records"))
+def before_live(df, output_path, carried=None, curve_folder=curve_store.CURVE_FOLDER):
+    """
+    Computes the stats for every row of df and streams each finished row, merged
+    with its df columns, into output_path. Only a bounded window of rows is ever
+    held in memory; output_path + ".partial" shows progress during the run.
+    Rows of the `carried` frame (complete from an earlier run) keep their
+    BeforeLive stats and only have the to_today_eras recomputed.
+    Rows are written in order, carried rows first and then df's; a slow row
+    holds back new work instead of the rows after it piling up in memory.
+    """
+    columns = output_columns(list(df.columns) + stat_columns())
+    rows = (
+        (dict(zip(df.columns, values)), era_prefixes)
+        for values in df.itertuples(index=False, name=None)
+    )
+    if carried is not None:
+        carried_rows = (
+            (dict(zip(columns, values)), to_today_eras)
+            for values in carried.reindex(columns=columns).itertuples(
+                index=False, name=None
+            )
+        )
+        rows = itertools.chain(carried_rows, rows)
+    with scheduler.CsvRowSink(output_path, columns) as sink:
+        with run_metrics.InstrumentedExecutor("before_live", max_workers) as executor:
+            for (row, _), future in scheduler.ordered_map(
+                executor,
+                lambda item: process_row(item[0], curve_folder, item[1]),
+                rows,
+                scheduler.in_flight_limit(max_workers),
+            ):
+                results = future.result()
+                if results is None:
+                    continue
+                results.pop(row["id"], None)
+                sink.write({**row, **results})
+    v_print(f"{sink.rows_written} rows written to {output_path}")
+
+
+def output_columns(columns):
+    remaining_columns = sorted([col for col in columns if col not in first_columns])
+    return first_columns + remaining_columns
+
+
+def build_indexes(df):
+    """
+    Universe-wide derived data the dashboard reads: the rolling-stat panels,
+    the ticker index over the score features, and the correlation search index
+    over the returns matrix compute_corr published.
+    """
+    with run_metrics.stage("build-indexes"):
+        for window in rolling_stats.ROLLING_WINDOWS:
+            v_print(f"building rolling stats panel for {window}d windows")
+            panel = rolling_stats.build_rolling_panel(df["id"], window)
+            rolling_stats.save_rolling_panel(panel)
+
+        # the features fetch-metadata (or merge_shards) saved; no score requests
+        features = score_features.load_features()
+        missing = sum(1 for symph_id in df["id"] if symph_id not in features)
+        if missing:
+            v_print(
+                f"{missing} symphonies have no score features, left out of the index"
+            )
+        ticker_index = score_features.build_ticker_index(
+            {
+                symph_id: features[symph_id]
+                for symph_id in df["id"]
+                if symph_id in features
+            }
+        )
+        score_features.save_ticker_index(ticker_index)
+        v_print(
+            f"ticker index: {len(ticker_index['tickers'])} tickers "
+            f"over {len(ticker_index['ids'])} symphonies"
+        )
+
+        matrix = matrix_store.attach()
+        if matrix is None:
+            v_print("no returns matrix yet; run compute-corr before the index")
+            return
+        try:
+            index = correlation_index.update_index(
+                correlation_index.load_index(), matrix
+            )
+        finally:
+            matrix_store.release(matrix)
+        correlation_index.save_index(index)
+        v_print(
+            f"correlation index: {len(index['ids'])} symphonies "
+            f"in {len(index['centroids'])} lists"
         )
-        results = list(all_results)
 
-    for curr_row_dict in results:
-        if curr_row_dict is None:
+
+def build_returns_matrix(df, curve_folder=curve_store.CURVE_FOLDER):
+    """The aligned 12-month returns matrix of df's symphonies, one curve each."""
+    curves = {}
+    with run_metrics.InstrumentedExecutor("returns_matrix", max_workers) as executor:
+        for symph_id, future in scheduler.stream_map(
+            executor,
+            lambda symph_id: get_full_curve(symph_id, curve_folder=curve_folder),
+            df["id"],
+            scheduler.in_flight_limit(max_workers),
+        ):
+            curve = future.result()
+            if curve is not None:
+                curves[symph_id] = curve
+    start_days = {
+        symph_id: time_index.date_to_epoch_day(start_date)
+        for symph_id, start_date in zip(df["id"], df["algo_start_date"])
+    }
+    # keep the universe order rather than completion order
+    curves = {symph_id: curves[symph_id] for symph_id in df["id"] if symph_id in curves}
+    # ending on the last market day rather than today keeps the window (and the
+    # correlation index built on it) unchanged across days without a new close
+    return returns_matrix.build_returns_matrix(
+        curves, start_days, latest_market_day_int()
+    )
+
+
+def compute_corr(df, corr_path=CORR_PATH):
+    """
+    Correlation of daily returns for every era, all from one aligned returns
+    matrix, which is also published (matrix_store) for on-demand lookups.
+    Clone groups are fingerprinted from the same matrix first.
+    """
+    with run_metrics.stage("returns-matrix"):
+        matrix = build_returns_matrix(df)
+        matrix_store.publish(matrix)
+
+    with run_metrics.stage("fingerprint"):
+        groups = clone_groups.find_clone_groups(
+            matrix["ids"], matrix["returns"], matrix["start_days"]
+        )
+        clone_groups.save_clone_groups(groups)
+        v_print(
+            f"{len(groups)} symphonies form "
+            f"{groups['clone_of'].nunique()} distinct clone groups"
+        )
+
+    with run_metrics.stage("compute-corr"):
+        if representatives_only:
+            keep = np.isin(matrix["ids"], clone_groups.representatives(groups))
+            matrix = dict(
+                matrix,
+                ids=matrix["ids"][keep],
+                returns=matrix["returns"][:, keep],
+                start_days=matrix["start_days"][keep],
+            )
+        names = dict(era)
+        for days, correlation_matrix in returns_matrix.era_correlations(
+            matrix, list(names)
+        ):
+            correlation_matrix.to_csv(corr_path.format(era=names[days]), index=True)
+            v_print(f"correlation for {names[days]} saved")
+
+
+def merge_into_output(columns, output_path=OUTPUT_PATH, dtype=None):
+    """
+    Replaces the given columns (a frame keyed by "id") in output_path, keeping
+    every other value exactly as written.
+    """
+    output = pd.read_csv(output_path, float_precision="round_trip")
+    names = [name for name in columns.columns if name != "id"]
+    output = output.drop(columns=names, errors="ignore").merge(
+        columns, on="id", how="left"
+    )
+    if dtype is not None:
+        output = output.astype({name: dtype for name in names})
+    output[output_columns(output.columns)].to_csv(output_path + ".tmp", index=False)
+    os.replace(output_path + ".tmp", output_path)
+
+
+def get_benchmark_curves(curve_folder=curve_store.CURVE_FOLDER):
+    """
+    {ticker: full-history (days, values)} of the benchmark tickers, kept in the
+    curve store under their tickers. Stale ones come from a single backtest of
+    the XOM probe that asks for every benchmark at once.
+    """
+    market_day = latest_market_day_int()
+    curves = {
+        ticker: curve_store.load_curve(ticker, curve_folder)
+        for ticker in benchmark_metrics.BENCHMARK_TICKERS
+    }
+    if all(
+        curve is not None and curve[0][-1] >= market_day for curve in curves.values()
+    ):
+        run_metrics.record_cache("curves", hit=True)
+        return curves
+    run_metrics.record_cache("curves", hit=False)
+
+    result = single_backtest(
+        XOM_SYMPH_ID,
+        DATE_1990,
+        DATE_TODAY.strftime("%Y-%m-%d"),
+        benchmark_tickers=benchmark_metrics.BENCHMARK_TICKERS,
+    )
+    for ticker in benchmark_metrics.BENCHMARK_TICKERS:
+        dvm_capital = (result or {}).get("dvm_capital", {}).get(ticker)
+        if not dvm_capital:
+            v_print(f"No benchmark curve for {ticker}")
+            curves.pop(ticker)
             continue
-        symph_id_key = list(curr_row_dict.keys())[0]
-        symph_id = curr_row_dict.pop(symph_id_key)
+        days, values = curve_store.curve_from_dvm_capital(dvm_capital)
+        curve_store.save_curve(ticker, days, values, curve_folder)
+        curves[ticker] = days, values
+    return curves
 
-        # copy data for symph_id into df
-        for column_key, value in curr_row_dict.items():
-            matching_rows = df.index[df["id"] == symph_id].tolist()
-            if matching_rows:
-                row_index = matching_rows[0]
-                df.at[row_index, column_key] = value
 
+def compute_benchmarks(output_path=OUTPUT_PATH):
+    """
+    Beta, alpha, up/down capture and correlation of every symphony against each
+    benchmark for the trailing eras, from the published returns matrix, into
+    output_path.
+    """
+    with run_metrics.stage("benchmark"):
+        curves = get_benchmark_curves()
+        matrix = matrix_store.attach()
+        if matrix is None:
+            v_print("no returns matrix yet; run compute-corr before benchmarks")
+            return
+        try:
+            benchmarks = {
+                ticker: returns_matrix.curve_returns(matrix, *curve)
+                for ticker, curve in curves.items()
+            }
+            table = benchmark_metrics.benchmark_table(matrix, benchmarks, era)
+        finally:
+            matrix_store.release(matrix)
+        merge_into_output(table, output_path)
+        v_print(f"benchmark stats against {', '.join(curves)} written to {output_path}")
 
-def decode_era(era_str):
-    for days, string in era:
-        if string == era_str:
-            return days
-    return None
 
+def cluster_universe(output_path=OUTPUT_PATH):
+    """
+    Strategy families over the published returns matrix: cluster_id and
+    cluster_size are written into output_path, the representatives and the
+    linkage into strategy_clusters' sidecar files.
+    """
+    with run_metrics.stage("cluster"):
+        matrix = matrix_store.attach()
+        if matrix is None:
+            v_print("no returns matrix yet; run compute-corr before clustering")
+            return
+        try:
+            clusters, linkage = strategy_clusters.cluster_universe(
+                matrix["ids"], matrix["returns"]
+            )
+        finally:
+            matrix_store.release(matrix)
+        strategy_clusters.save_clusters(clusters, linkage)
+        v_print(
+            f"{len(clusters)} symphonies in {clusters['cluster_id'].nunique()} "
+            f"clusters, {int((clusters['cluster_size'] > 1).sum())} of them clustered"
+        )
+
+        merge_into_output(
+            clusters[["id", *strategy_clusters.OUTPUT_COLUMNS]], output_path, "Int64"
+        )
 
-def read_curve(symphony_id, data_start, bt_start):
-    if isinstance(data_start, str):
-        data_start = pd.to_datetime(data_start)
-    if bt_start < data_start:
-        return None
-    backtest = single_backtest(
-        symphony_id,
-        bt_start,
-        DATE_TODAY,
+
+def take_snapshot(output_path=OUTPUT_PATH):
+    """Appends today's output_path to the snapshot store (see snapshot_store)."""
+    with run_metrics.stage("snapshot"):
+        table = pd.read_csv(output_path, float_precision="round_trip")
+        changed = snapshot_store.append_snapshot(table, DATE_TODAY.isoformat())
+        v_print(
+            f"snapshot of {len(table)} symphonies taken, {changed} cells changed; "
+            f"{snapshot_store.storage_bytes()} bytes of snapshots in total"
+        )
+
+
+def run_universe_stages(df, corr_path=CORR_PATH, output_path=OUTPUT_PATH):
+    """
+    Stages that need the whole universe at once: correlation, clustering,
+    benchmark stats, indexes, then the day's snapshot of the finished table.
+    """
+    compute_corr(df, corr_path)
+    cluster_universe(output_path)
+    compute_benchmarks(output_path)
+    build_indexes(df)
+    take_snapshot(output_path)
+
+
+def write_run_summary(path="run_summary.json"):
+    response_cache.flush_access()
+    run_metrics.write_summary(path)
+    v_print(f"Run summary written to {path}")
+
+
+def fetch_metadata(
+    universe_path=UNIVERSE_PATH,
+    metadata_path=METADATA_PATH,
+    shard=None,
+    curve_folder=curve_store.CURVE_FOLDER,
+):
+    """Live dates, sizes and first curve days of the universe, saved to metadata_path."""
+    # one-off move of responses cached as individual files into the index
+    for folder_name in cache_manager.LEGACY_FOLDERS:
+        cache_manager.import_legacy(folder_name)
+
+    features = {}
+    with run_metrics.stage("fetch-metadata"):
+        df = get_symph_dates(shard, curve_folder, universe_path, features)
+    df.to_csv(metadata_path, index=False)
+    v_print(f"{len(df)} symphonies written to {metadata_path}")
+    # build-indexes reads these instead of asking the API for every score again
+    score_features.save_features(
+        features,
+        os.path.join(os.path.dirname(metadata_path), score_features.FEATURES_PATH),
     )
-    raw_dvm_capital = backtest["dvm_capital"][symphony_id]
-    sorted_dvm_capital = dict(sorted(raw_dvm_capital.items()))
-    values = list(sorted_dvm_capital.values())
-    return np.array(values)
+    return df
 
 
-def get_corr(df, the_era):
-    v_print("getting data for corr")
-    days = decode_era(the_era)
-    if not days:
-        return
-    all_curves = {}
-    for _, row in df.iterrows():
-        curve = read_curve(
-            row["id"],
-            row["algo_start_date"],
-            DATE_TODAY - datetime.timedelta(days=days),
+def load_table(path):
+    """The first_columns of a metadata or output file."""
+    return pd.read_csv(path, usecols=first_columns)
+
+
+def split_since(df, since, output_path=OUTPUT_PATH):
+    """
+    For incremental runs: (rows to recompute, complete rows to carry over).
+    A symphony is recomputed when it was edited (went live again) on or after
+    `since` or has no row in the existing output. Everything else keeps its
+    BeforeLive stats, which cannot change until it is edited again; its decay
+    and to-today (AfterLive, BeforeToday) stats are still recomputed.
+    """
+    if since is None or not os.path.exists(output_path):
+        return df, None
+    existing = pd.read_csv(output_path, float_precision="round_trip")
+    since = time_index.date_to_epoch_day(since)
+    edited = df["algo_live_date"].map(time_index.date_to_epoch_day) >= since
+    todo = df[edited | ~df["id"].isin(existing["id"])]
+    carried = existing[existing["id"].isin(df["id"]) & ~existing["id"].isin(todo["id"])]
+    v_print(f"--since: recomputing {len(todo)} rows, carrying over {len(carried)}")
+    return todo.reset_index(drop=True), carried
+
+
+def fetch_curves(df, curve_folder=curve_store.CURVE_FOLDER):
+    """Brings the curve store up to the latest market day for every row of df."""
+    with run_metrics.stage("fetch-curves"):
+        with run_metrics.InstrumentedExecutor("fetch_curves", max_workers) as executor:
+            for symph_id, future in scheduler.stream_map(
+                executor,
+                lambda symph_id: get_full_curve(symph_id, curve_folder=curve_folder),
+                df["id"],
+                scheduler.in_flight_limit(max_workers),
+            ):
+                if future.result() is None:
+                    v_print(f"No curve for {symph_id}")
+
+
+def validate_curves(
+    df,
+    curve_folder=curve_store.CURVE_FOLDER,
+    quality_path=curve_quality.CURVE_QUALITY_PATH,
+):
+    """
+    Checks the cached curves of df all at once (curve_quality): repaired curves
+    replace the cached ones, the flags go to quality_path, and df comes back
+    without the symphonies whose curves are excluded.
+    """
+    with run_metrics.stage("validate-curves"):
+        curves = {}
+        with run_metrics.InstrumentedExecutor(
+            "validate_curves", max_workers
+        ) as executor:
+            for symph_id, future in scheduler.stream_map(
+                executor,
+                lambda symph_id: curve_store.load_curve(symph_id, curve_folder),
+                df["id"],
+                scheduler.in_flight_limit(max_workers),
+            ):
+                if future.result() is not None:
+                    curves[symph_id] = future.result()
+        # keep the universe order rather than completion order
+        curves = {i: curves[i] for i in df["id"] if i in curves}
+        flags, repaired = curve_quality.validate_curves(curves, latest_market_day_int())
+        for symph_id, (days, values) in repaired.items():
+            curve_store.save_curve(symph_id, days, values, curve_folder)
+        curve_quality.save_flags(flags, quality_path)
+    counts = flags["status"].value_counts()
+    v_print(
+        f"{len(flags)} curves checked: {counts.get('repaired', 0)} repaired, "
+        f"{counts.get('excluded', 0)} excluded; flags in {quality_path}"
+    )
+    return curve_quality.keep_valid(df, flags)
+
+
+def compute_stats(
+    df,
+    output_path=OUTPUT_PATH,
+    curve_folder=curve_store.CURVE_FOLDER,
+    since=None,
+    previous_path=None,
+):
+    """Live decay and per-era stats into output_path; see split_since for `since`."""
+    todo, carried = split_since(df, since, previous_path or output_path)
+    with run_metrics.stage("live-decay"):
+        decay = live_decay.compute_live_decay(todo, curve_folder)
+        todo = pd.concat([todo, decay], axis=1)
+        if carried is not None:
+            # the post-live side grows every day, edited or not
+            decay = live_decay.compute_live_decay(carried, curve_folder)
+            carried = carried.assign(**decay)
+    with run_metrics.stage("compute-stats"):
+        before_live(todo, output_path, carried, curve_folder)
+
+
+def merge_shards(shard_count, output_path=OUTPUT_PATH, corr_path=CORR_PATH):
+    """
+    Combines the partial outputs, curve-store segments and score features
+    written by `--shard i/N` runs (copied into shards/ on this box), then runs the
+    universe-wide stages on the merged table.
+    """
+    shard_outputs = []
+    for shard_index in range(shard_count):
+        shard_dir = shard_folder(shard_index, shard_count)
+        shard_output = os.path.join(shard_dir, "output.csv")
+        if not os.path.exists(shard_output):
+            v_print(f"Missing shard output {shard_output}, not merging")
+            return None
+        shard_outputs.append(shard_output)
+
+    # stream the shard files into the output rather than loading them all
+    header = None
+    with open(output_path, "w", newline="") as merged:
+        for shard_output in shard_outputs:
+            with open(shard_output, newline="") as shard_file:
+                shard_header = shard_file.readline()
+                if header is None:
+                    header = shard_header
+                    merged.write(header)
+                elif shard_header != header:
+                    raise ValueError(
+                        f"Column mismatch in {shard_output}: the shards were run "
+                        "with different code or options"
+                    )
+                shutil.copyfileobj(shard_file, merged)
+
+    for shard_index in range(shard_count):
+        shard_curves = os.path.join(shard_folder(shard_index, shard_count), "curves")
+        if os.path.exists(shard_curves):
+            ensure_folder_exists(curve_store.CURVE_FOLDER)
+            for file_name in os.listdir(shard_curves):
+                shutil.copyfile(
+                    os.path.join(shard_curves, file_name),
+                    os.path.join(curve_store.CURVE_FOLDER, file_name),
+                )
+
+    features = {}
+    for shard_index in range(shard_count):
+        features.update(
+            score_features.load_features(
+                os.path.join(
+                    shard_folder(shard_index, shard_count),
+                    score_features.FEATURES_PATH,
+                )
+            )
         )
-        if curve is not None:
-            all_curves[row["id"]] = curve
+    score_features.save_features(features)
 
-    all_curves_df = pd.DataFrame(all_curves)
-    v_print(f"computing corr for {the_era}")
-    correlation_matrix = all_curves_df.corr()
-    v_print("compute corr done - saving to csv")
-    correlation_matrix.to_csv(f"correlation_matrix_{the_era}.csv", index=True)
-    v_print("CSV done")
+    df = load_table(output_path)
+    v_print(f"Merged {shard_count} shards into {output_path} ({len(df)} rows)")
+
+    run_universe_stages(df, corr_path, output_path)
+    write_run_summary()
+    return df
 
 
-def main():
-    df = get_symph_dates()
-    before_live(df)
+def main(
+    shard=None,
+    universe_path=UNIVERSE_PATH,
+    metadata_path=METADATA_PATH,
+    output_path=OUTPUT_PATH,
+    corr_path=CORR_PATH,
+    since=None,
+):
+    """Every stage, in order. A shard run stops after its partial output."""
+    curve_folder = curve_store.CURVE_FOLDER
+    quality_path = curve_quality.CURVE_QUALITY_PATH
+    previous_path = output_path
+    if shard is not None:
+        # partial results only -- merge_shards builds the output and the rest
+        curve_folder = os.path.join(shard_folder(*shard), "curves")
+        ensure_folder_exists(shard_folder(*shard))
+        metadata_path = os.path.join(shard_folder(*shard), METADATA_PATH)
+        output_path = os.path.join(shard_folder(*shard), "output.csv")
+        quality_path = os.path.join(shard_folder(*shard), quality_path)
+
+    # fetch-metadata already brings every curve it looks at up to date
+    df = fetch_metadata(universe_path, metadata_path, shard, curve_folder)
+    df = validate_curves(df, curve_folder, quality_path)
+    compute_stats(df, output_path, curve_folder, since, previous_path)
+
+    if shard is not None:
+        v_print(f"Shard {shard[0]}/{shard[1]} done: {len(df)} rows in {output_path}")
+        write_run_summary(os.path.join(shard_folder(*shard), "run_summary.json"))
+        return
 
-    first_columns = ["id", "algo_size", "algo_start_date", "algo_live_date"]
-    remaining_columns = sorted([col for col in df.columns if col not in first_columns])
-    new_order = first_columns + remaining_columns
-    df = df[new_order]
+    run_universe_stages(df, corr_path, output_path)
+    write_run_summary()
 
-    df.to_csv("output.csv", index=False)
-    print(df.tail(10))
 
-    #############################
-    for _, string in era:
-        get_corr(df, string)
+def run_processes(args, process_count):
+    """
+    Runs the whole pipeline as process_count shard processes on this host, each
+    with its share of the rate limit, then merges their outputs here.
+    """
+    # once here, before the children's fetch_metadata would all race for it
+    for folder_name in cache_manager.LEGACY_FOLDERS:
+        cache_manager.import_legacy(folder_name)
+    child_args = [
+        "all",
+        "--universe",
+        args.universe,
+        "--output",
+        args.output,
+        "--rate",
+        str(fetch_service.configured_rate() / process_count),
+    ]
+    if args.workers is not None:
+        child_args += ["--workers", str(args.workers)]
+    if args.since is not None:
+        child_args += ["--since", args.since]
+    if args.local_stats:
+        child_args.append("--local-stats")
+    children = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)]
+            + child_args
+            + ["--shard", f"{shard_index}/{process_count}"]
+        )
+        for shard_index in range(process_count)
+    ]
+    failed = [child.args[-1] for child in children if child.wait() != 0]
+    if failed:
+        v_print(f"Shard processes failed: {', '.join(failed)}; not merging")
+        return None
+    return merge_shards(process_count, args.output, args.corr_output)
 
 
 # before live
@@ -567,4 +1236,124 @@ def main():
 # more than 12
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Crawl the symphony universe and compute the dashboard tables"
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="all",
+        choices=["all"] + STAGES,
+        help="stage to run (default: all of them, in order)",
+    )
+    parser.add_argument("--universe", default=UNIVERSE_PATH, help="symphony id list")
+    parser.add_argument(
+        "--metadata",
+        default=METADATA_PATH,
+        help="written by fetch-metadata, read by fetch-curves and compute-stats",
+    )
+    parser.add_argument(
+        "--output",
+        default=OUTPUT_PATH,
+        help="written by compute-stats and cluster, read by the later stages",
+    )
+    parser.add_argument(
+        "--corr-output",
+        default=CORR_PATH,
+        help="correlation matrix path pattern, {era} is replaced by the era",
+    )
+    parser.add_argument("--workers", type=int, help="threads per stage")
+    parser.add_argument(
+        "--local-stats",
+        action="store_true",
+        help="compute era stats from the curve store instead of remote backtests",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="run `all` as this many shard processes, then merge",
+    )
+    parser.add_argument(
+        "--rate", type=float, help="remote requests per second (0 = unlimited)"
+    )
+    parser.add_argument("--burst", type=float, help="requests allowed back to back")
+    parser.add_argument(
+        "--representatives-only",
+        action="store_true",
+        help="correlate one symphony per clone group",
+    )
+    parser.add_argument(
+        "--since",
+        metavar="YYYY-MM-DD",
+        help="fully recompute only symphonies edited since this day; the others "
+        "keep their BeforeLive stats",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="only crawl partition i of N (0-based), e.g. --shard 0/4",
+    )
+    parser.add_argument(
+        "--merge",
+        type=int,
+        metavar="N",
+        help="merge the outputs of N shard runs into the output file",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["cprofile", "sample"],
+        help="profile pipeline stages into profiles/",
+    )
+    parser.add_argument(
+        "--profile-stage",
+        action="append",
+        dest="profile_stages",
+        metavar="STAGE",
+        help="only profile this stage (repeatable, default all)",
+    )
+    args = parser.parse_args()
+    run_metrics.configure_profiling(args.profile, args.profile_stages)
+    if args.rate is not None or args.burst is not None:
+        fetch_service.configure(args.rate, args.burst)
+    max_workers = args.workers
+    local_stats = args.local_stats
+    representatives_only = args.representatives_only
+
+    if args.merge:
+        merge_shards(args.merge, args.output, args.corr_output)
+    elif args.command == "all" and args.processes > 1 and args.shard is None:
+        run_processes(args, args.processes)
+    elif args.command == "all":
+        main(
+            args.shard,
+            args.universe,
+            args.metadata,
+            args.output,
+            args.corr_output,
+            args.since,
+        )
+    else:
+        if args.command == "fetch-metadata":
+            fetch_metadata(args.universe, args.metadata)
+        elif args.command == "fetch-curves":
+            fetch_curves(load_table(args.metadata))
+        elif args.command == "validate-curves":
+            validate_curves(load_table(args.metadata))
+        elif args.command == "compute-stats":
+            # without the curves the last validate-curves excluded
+            df = curve_quality.keep_valid(
+                load_table(args.metadata), curve_quality.load_flags()
+            )
+            compute_stats(df, args.output, since=args.since)
+        elif args.command == "compute-corr":
+            compute_corr(load_table(args.output), args.corr_output)
+        elif args.command == "cluster":
+            cluster_universe(args.output)
+        elif args.command == "benchmark":
+            compute_benchmarks(args.output)
+        elif args.command == "build-indexes":
+            build_indexes(load_table(args.output))
+        elif args.command == "snapshot":
+            take_snapshot(args.output)
+        write_run_summary()
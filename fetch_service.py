@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+# priority classes -- lower value is served first
+INTERACTIVE = 0
+BATCH = 1
+
+# The dashboard and the nightly crawl run as separate processes against the same
+# remote quota, each with its own bucket at the full rate. Interactive fetches
+# touch this file; while it is fresh, batch fetches in every process on the host
+# hold off entirely, so the two together never exceed the configured rate.
+ACTIVITY_FILE = ".interactive_fetch"
+INTERACTIVE_GRACE_S = 10
+# how often a held-off batch fetch looks at the activity file again
+BATCH_RECHECK_S = 0.5
+
+_condition = threading.Condition()
+_rate = float(os.environ.get("XDASH_BACKTEST_RATE", 10))  # requests per second
+_burst = max(1.0, _rate)
+_tokens = _burst
+_last_refill = time.monotonic()
+_waiting = {INTERACTIVE: 0, BATCH: 0}
+_activity_checked = 0.0
+_activity_seen = False
+
+
+def configure(rate=None, burst=None):
+    """Sets the shared request budget; a rate of 0 disables rate limiting."""
+    global _rate, _burst, _tokens
+    with _condition:
+        if rate is not None:
+            _rate = float(rate)
+        _burst = float(burst) if burst is not None else max(1.0, _rate)
+        _tokens = min(_tokens, _burst)
+        _condition.notify_all()
+
+
+def configured_rate():
+    return _rate
+
+
+def _refill(now):
+    global _tokens, _last_refill
+    _tokens = min(_burst, _tokens + (now - _last_refill) * _rate)
+    _last_refill = now
+
+
+def _mark_interactive():
+    global _activity_checked, _activity_seen
+    # this process knows right away; others notice on their next stat
+    _activity_checked = time.time()
+    _activity_seen = True
+    try:
+        with open(ACTIVITY_FILE, "a"):
+            pass
+        os.utime(ACTIVITY_FILE)
+    except OSError:
+        pass
+
+
+def interactive_active(now=None):
+    """True while any process on this host made an interactive fetch recently."""
+    global _activity_checked, _activity_seen
+    now = time.time() if now is None else now
+    # stat at most once a second, not once per request
+    if now - _activity_checked >= 1:
+        _activity_checked = now
+        try:
+            _activity_seen = now - os.path.getmtime(ACTIVITY_FILE) < INTERACTIVE_GRACE_S
+        except OSError:
+            _activity_seen = False
+    return _activity_seen
+
+
+def acquire(priority=BATCH):
+    """
+    Blocks until a request of this priority may go out. Lower-priority callers
+    wait while any higher-priority caller in this process is queued, and batch
+    callers while any process on the host is fetching interactively.
+    """
+    global _tokens
+    if priority == INTERACTIVE:
+        _mark_interactive()
+
+    with _condition:
+        _waiting[priority] += 1
+        try:
+            while True:
+                if _rate <= 0:
+                    return
+                now = time.monotonic()
+                _refill(now)
+                preempted = any(
+                    count for other, count in _waiting.items() if other < priority
+                )
+                if priority == BATCH and interactive_active():
+                    wait_s = BATCH_RECHECK_S
+                elif not preempted and _tokens >= 1:
+                    _tokens -= 1
+                    return
+                else:
+                    wait_s = (1 - _tokens) / _rate
+                _condition.wait(timeout=max(wait_s, 0.005))
+        finally:
+            _waiting[priority] -= 1
+            _condition.notify_all()
@@ -0,0 +1,160 @@
+import curve_store
+import numpy as np
+import pandas as pd
+import time_index
+import warnings
+
+TRADING_DAYS_PER_YEAR = 252
+MIN_MATCHED_RETURNS = 10
+
+
+def matched_returns(days, values, live_day):
+    """
+    Splits one curve into equal-length calendar windows either side of live_day.
+
+    The window length is the shorter of the live history and the backtest history,
+    so the pre-live window is (live - L, live] and the post-live one (live, live + L].
+    """
+    span = min(int(days[-1]) - live_day, live_day - int(days[0]))
+    if span <= 0:
+        return None, None, 0
+    returns = values[1:] / values[:-1] - 1
+    return_days = days[1:]
+    pre = returns[(return_days > live_day - span) & (return_days <= live_day)]
+    post = returns[(return_days > live_day) & (return_days <= live_day + span)]
+    return pre, post, span
+
+
+def pad_rows(rows):
+    width = max((len(row) for row in rows), default=0)
+    out = np.full((len(rows), max(width, 1)), np.nan)
+    for i, row in enumerate(rows):
+        out[i, : len(row)] = row
+    return out
+
+
+def sharpe(returns):
+    # rows without a usable window are all-NaN; they come back NaN without warnings
+    with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(returns, axis=1)
+        std = np.nanstd(returns, axis=1, ddof=1)
+        return np.where(std > 0, mean / std * np.sqrt(TRADING_DAYS_PER_YEAR), np.nan)
+
+
+def total_return(returns):
+    return np.expm1(np.nansum(np.log1p(returns), axis=1))
+
+
+def max_drawdown(returns):
+    # NaN padding sits after the data, so treating it as a flat day is harmless
+    growth = np.cumprod(1 + np.nan_to_num(returns), axis=1)
+    growth = np.hstack([np.ones((len(growth), 1)), growth])
+    return -np.min(growth / np.maximum.accumulate(growth, axis=1) - 1, axis=1)
+
+
+def kolmogorov_sf(x):
+    """Asymptotic Kolmogorov survival function, Q(x) = 2 sum (-1)^(k-1) exp(-2 k^2 x^2)."""
+    x = np.asarray(x, dtype=np.float64)
+    k = np.arange(1, 101)
+    terms = (-1.0) ** (k - 1) * np.exp(-2.0 * k * k * x[..., None] ** 2)
+    # the series only converges away from zero, where Q is 1 to float precision
+    return np.where(x < 0.04, 1.0, np.clip(2 * terms.sum(axis=-1), 0, 1))
+
+
+def ks_two_sample(pre, post):
+    """
+    Row-wise two-sample Kolmogorov-Smirnov test over NaN-padded matrices.
+
+    Each row is shifted into its own value band so one global searchsorted
+    counts "<= z" for every row at once.
+    """
+    n1 = np.sum(~np.isnan(pre), axis=1)
+    n2 = np.sum(~np.isnan(post), axis=1)
+    band = 2 * max(
+        np.nanmax(np.abs(pre), initial=0), np.nanmax(np.abs(post), initial=0)
+    )
+    offsets = np.arange(len(pre))[:, None] * (band + 1)
+
+    pre_sorted = np.sort(pre, axis=1) + offsets
+    post_sorted = np.sort(post, axis=1) + offsets
+    flat_pre = pre_sorted[~np.isnan(pre_sorted)]
+    flat_post = post_sorted[~np.isnan(post_sorted)]
+    pre_starts = np.concatenate([[0], np.cumsum(n1)[:-1]])
+    post_starts = np.concatenate([[0], np.cumsum(n2)[:-1]])
+
+    # the supremum of |F1 - F2| is attained at one of the pooled sample points
+    points = np.hstack([pre_sorted, post_sorted])
+    rows = np.broadcast_to(np.arange(len(pre))[:, None], points.shape)
+    valid = ~np.isnan(points)
+    z = points[valid]
+    row = rows[valid]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cdf_pre = (np.searchsorted(flat_pre, z, side="right") - pre_starts[row]) / n1[
+            row
+        ]
+        cdf_post = (
+            np.searchsorted(flat_post, z, side="right") - post_starts[row]
+        ) / n2[row]
+
+    distance = np.zeros(len(pre))
+    np.maximum.at(distance, row, np.abs(cdf_pre - cdf_post))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effective_n = n1 * n2 / (n1 + n2)
+    p_value = kolmogorov_sf(np.sqrt(np.nan_to_num(effective_n)) * distance)
+
+    usable = (n1 >= MIN_MATCHED_RETURNS) & (n2 >= MIN_MATCHED_RETURNS)
+    return np.where(usable, distance, np.nan), np.where(usable, p_value, np.nan)
+
+
+def compute_live_decay(df, folder=curve_store.CURVE_FOLDER):
+    """
+    Compares matched pre-live and post-live windows for every row of df from the
+    cached curves alone (no API calls). Returns a DataFrame indexed like df.
+    """
+    pre_rows = []
+    post_rows = []
+    spans = []
+    for symph_id, live_date in zip(df["id"], df["algo_live_date"]):
+        pre = post = None
+        span = 0
+        curve = curve_store.load_curve(symph_id, folder)
+        if curve is not None and not pd.isna(live_date):
+            days, values = curve
+            pre, post, span = matched_returns(
+                days, values, time_index.date_to_epoch_day(live_date)
+            )
+        if pre is None or min(len(pre), len(post)) < MIN_MATCHED_RETURNS:
+            pre, post, span = np.empty(0), np.empty(0), np.nan
+        pre_rows.append(pre)
+        post_rows.append(post)
+        spans.append(span)
+
+    pre = pad_rows(pre_rows)
+    post = pad_rows(post_rows)
+    usable = ~np.isnan(np.array(spans, dtype=np.float64))
+
+    stats = {
+        "Sharpe": (sharpe(pre), sharpe(post)),
+        "GainTotalPct": (total_return(pre) * 100, total_return(post) * 100),
+        "DrawdownMaxPct": (max_drawdown(pre) * 100, max_drawdown(post) * 100),
+    }
+
+    decay = pd.DataFrame(index=df.index)
+    decay["Decay_WindowDays"] = spans
+    for stat_name, (before, after) in stats.items():
+        before = np.where(usable, before, np.nan)
+        after = np.where(usable, after, np.nan)
+        decay[f"Decay_{stat_name}_BeforeLive"] = before
+        decay[f"Decay_{stat_name}_AfterLive"] = after
+        decay[f"Decay_{stat_name}_Diff"] = after - before
+        with np.errstate(divide="ignore", invalid="ignore"):
+            decay[f"Decay_{stat_name}_Ratio"] = np.where(
+                before != 0, after / before, np.nan
+            )
+
+    ks_stat, ks_p_value = ks_two_sample(pre, post)
+    decay["Decay_KS_Stat"] = ks_stat
+    decay["Decay_KS_PValue"] = ks_p_value
+    return decay
@@ -0,0 +1,197 @@
+import atexit
+import numpy as np
+import os
+import shutil
+import threading
+import time
+
+# The published returns matrix: one folder per version of plain .npy files that
+# every process maps read-only, so the OS keeps a single copy per host however
+# many dashboard sessions, queries and pipeline workers read it.
+#
+#   returns_matrix/CURRENT               name of the version to attach
+#   returns_matrix/<version>/*.npy       ids, days, returns (float32), ...
+#   returns_matrix/<version>/leases/<pid>   one per process attached to it
+#
+# Publishing writes a new version and then swaps CURRENT, so readers never see
+# a partial matrix. A version is deleted once it is no longer CURRENT and no
+# live process holds a lease on it.
+#
+#   returns_matrix/<version>.<pid>.tmp   a version being written by process pid
+MATRIX_FOLDER = "returns_matrix"
+CURRENT_NAME = "CURRENT"
+LEASE_FOLDER = "leases"
+ARRAYS = ["ids", "days", "returns", "start_days", "end_day"]
+
+_lock = threading.RLock()
+# version path -> [matrix, attach count] for this process
+_attached = {}
+# folder -> matrix of the version current() last handed out
+_current = {}
+
+
+def current_version(folder=MATRIX_FOLDER):
+    try:
+        with open(os.path.join(folder, CURRENT_NAME)) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish(matrix, folder=MATRIX_FOLDER):
+    """Writes a returns_matrix matrix as a new version and makes it current."""
+    version = f"{matrix['end_day']}-{time.time_ns()}"
+    tmp_path = os.path.join(folder, f"{version}.{os.getpid()}.tmp")
+    os.makedirs(os.path.join(tmp_path, LEASE_FOLDER))
+    try:
+        for name in ARRAYS:
+            array = np.asarray(matrix[name])
+            if name == "returns":
+                array = array.astype(np.float32)
+            np.save(os.path.join(tmp_path, name + ".npy"), array)
+        os.rename(tmp_path, os.path.join(folder, version))
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    current_path = os.path.join(folder, CURRENT_NAME)
+    with open(current_path + ".tmp", "w") as file:
+        file.write(version)
+    os.replace(current_path + ".tmp", current_path)
+    cleanup(folder)
+    return version
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def attach(version=None, folder=MATRIX_FOLDER):
+    """
+    Maps a version (default: the current one) read-only and leases it for this
+    process. Returns the matrix dict, or None when nothing is published. Every
+    attach needs a matching release.
+    """
+    if version is not None:
+        return _attach(version, folder)
+    # a version can be cleaned up between reading CURRENT and leasing it, but
+    # only after CURRENT has moved on; read it again
+    for attempt in range(3):
+        version = current_version(folder)
+        if version is None:
+            return None
+        try:
+            return _attach(version, folder)
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+
+
+def _attach(version, folder):
+    path = os.path.join(folder, version)
+    with _lock:
+        if path in _attached:
+            _attached[path][1] += 1
+            return _attached[path][0]
+
+        lease = os.path.join(path, LEASE_FOLDER, str(os.getpid()))
+        # fails, rather than recreating the folder, if the version is gone
+        open(lease, "w").close()
+        try:
+            matrix = {
+                name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                for name in ARRAYS
+            }
+        except FileNotFoundError:
+            _remove(lease)
+            raise
+        matrix["end_day"] = int(matrix["end_day"])
+        matrix["version"] = version
+        _attached[path] = [matrix, 1]
+        return matrix
+
+
+def release(matrix, folder=MATRIX_FOLDER):
+    """Drops one attach; the last one gives up this process's lease."""
+    path = os.path.join(folder, matrix["version"])
+    with _lock:
+        entry = _attached.get(path)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _attached[path]
+        _remove(os.path.join(path, LEASE_FOLDER, str(os.getpid())))
+    cleanup(folder)
+
+
+def current(folder=MATRIX_FOLDER):
+    """
+    The current version for long-lived readers (e.g. dashboard sessions). Once
+    a new version is published the next call attaches it and releases the old.
+    """
+    version = current_version(folder)
+    with _lock:
+        matrix = _current.get(folder)
+        if matrix is not None and matrix["version"] == version:
+            return matrix
+        _current[folder] = attach(version, folder) if version else None
+        if matrix is not None:
+            release(matrix, folder)
+        return _current[folder]
+
+
+def cleanup(folder=MATRIX_FOLDER):
+    """
+    Deletes versions that are neither current nor leased by a live process, and
+    half-written ones whose publishing process died.
+    """
+    if not os.path.isdir(folder):
+        return
+    current_name = current_version(folder)
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name == current_name or not os.path.isdir(path):
+            continue
+        if name.endswith(".tmp"):
+            pid = name[: -len(".tmp")].rpartition(".")[2]
+            if not pid.isdigit() or not _pid_alive(int(pid)):
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        lease_path = os.path.join(path, LEASE_FOLDER)
+        leases = os.listdir(lease_path) if os.path.isdir(lease_path) else []
+        live = False
+        for lease in leases:
+            if _pid_alive(int(lease)):
+                live = True
+            else:
+                # left behind by a process that died while attached
+                _remove(os.path.join(lease_path, lease))
+        if not live:
+            # a reader may still hold an open map; it stays valid on POSIX, and
+            # on Windows the removal fails and is retried by the next cleanup
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _release_all():
+    with _lock:
+        for path in _attached:
+            _remove(os.path.join(path, LEASE_FOLDER, str(os.getpid())))
+        _attached.clear()
+
+
+atexit.register(_release_all)
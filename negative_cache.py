@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+import response_cache
+import time_index
+
+# Symphonies that failed in a way that will not fix itself overnight. The batch
+# crawl skips them until their retry day instead of repeating the same calls
+# every night. Interactive lookups never consult this.
+NEGATIVE_PATH = os.path.join(response_cache.CACHE_FOLDER, "negative.sqlite")
+
+# reason -> (days until the first recheck, longest gap between rechecks); the
+# gap doubles with each consecutive failure
+RETRY_SCHEDULE = {
+    "forbidden": (7, 28),  # Firestore 403: private or deleted
+    "not_found": (7, 28),  # backtest API 404
+    "stale": (1, 7),  # curve stops before the latest market day: delisted assets
+    "no_data": (1, 7),  # backtest came back without a curve
+    "failed": (1, 1),  # still failing after retries
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS negative (
+    symph_id TEXT PRIMARY KEY,
+    reason TEXT NOT NULL,
+    strikes INTEGER NOT NULL,
+    first_day INTEGER NOT NULL,
+    last_day INTEGER NOT NULL,
+    retry_day INTEGER NOT NULL,
+    detail TEXT
+) WITHOUT ROWID;
+"""
+
+_lock = threading.Lock()
+_connection = None
+_entries = None
+
+
+def _load():
+    """Opens the table and reads it into memory once; it is small."""
+    global _connection, _entries
+    if _entries is None:
+        os.makedirs(os.path.dirname(NEGATIVE_PATH), exist_ok=True)
+        _connection = sqlite3.connect(
+            NEGATIVE_PATH, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        _connection.executescript(SCHEMA)
+        _entries = {
+            row[0]: row
+            for row in _connection.execute(
+                "SELECT symph_id, reason, strikes, first_day, last_day, retry_day,"
+                " detail FROM negative"
+            )
+        }
+    return _entries
+
+
+def retry_day(reason, strikes, today):
+    first_gap, max_gap = RETRY_SCHEDULE[reason]
+    return today + min(first_gap * 2 ** (strikes - 1), max_gap)
+
+
+def record(symph_id, reason, detail=None, today=None):
+    """Remembers a failure; a repeat of the same reason backs the recheck off."""
+    today = time_index.today_epoch_day() if today is None else today
+    with _lock:
+        entries = _load()
+        previous = entries.get(symph_id)
+        strikes = 1
+        first_day = today
+        if previous is not None and previous[1] == reason:
+            # the same failure on the same day (e.g. several callers) is one strike
+            strikes = previous[2] + (previous[4] != today)
+            first_day = previous[3]
+        row = (
+            symph_id,
+            reason,
+            strikes,
+            first_day,
+            today,
+            retry_day(reason, strikes, today),
+            detail,
+        )
+        _connection.execute(
+            "INSERT OR REPLACE INTO negative VALUES (?, ?, ?, ?, ?, ?, ?)", row
+        )
+        entries[symph_id] = row
+
+
+def clear(symph_id):
+    with _lock:
+        entries = _load()
+        if entries.pop(symph_id, None) is not None:
+            _connection.execute("DELETE FROM negative WHERE symph_id = ?", (symph_id,))
+
+
+def skip_reason(symph_id, today=None):
+    """The reason to skip symph_id today, or None when it is due (or unknown)."""
+    today = time_index.today_epoch_day() if today is None else today
+    with _lock:
+        entry = _load().get(symph_id)
+    if entry is None or today >= entry[5]:
+        return None
+    return entry[1]
+
+
+def split_due(symph_ids, today=None):
+    """(ids to crawl, {skipped id: reason}) for a batch run."""
+    due = []
+    skipped = {}
+    for symph_id in symph_ids:
+        reason = skip_reason(symph_id, today)
+        if reason is None:
+            due.append(symph_id)
+        else:
+            skipped[symph_id] = reason
+    return due, skipped
+
+
+def entries():
+    with _lock:
+        return [
+            {
+                "id": row[0],
+                "reason": row[1],
+                "strikes": row[2],
+                "first_seen": str(time_index.epoch_day_to_date(row[3])),
+                "last_seen": str(time_index.epoch_day_to_date(row[4])),
+                "retry_on": str(time_index.epoch_day_to_date(row[5])),
+                "detail": row[6],
+            }
+            for row in _load().values()
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Symphonies the crawl is skipping")
+    parser.add_argument("command", choices=["list", "forget"])
+    parser.add_argument("ids", nargs="*", help="ids to forget (default: all)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print(json.dumps(entries(), indent=2))
+    else:
+        for symph_id in args.ids or [entry["id"] for entry in entries()]:
+            clear(symph_id)
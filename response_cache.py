@@ -0,0 +1,316 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# One SQLite index maps (endpoint, symph_id, params) to a content-addressed blob
+# in append-only segment files, so a cache hit is one indexed query plus one
+# pread -- no per-file mkdir/exists/open probing.
+CACHE_FOLDER = "response_cache"
+INDEX_NAME = "index.sqlite"
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+# SQLite caps bound variables per statement; stay well under it
+BATCH_SIZE = 400
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_fd_lock = threading.Lock()
+_segment_fds = {}
+_accessed = {}
+_accessed_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    endpoint TEXT NOT NULL,
+    symph_id TEXT NOT NULL,
+    params TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (endpoint, symph_id, params)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _connection():
+    # sqlite3 connections are per thread; WAL lets readers run during writes
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        connection = sqlite3.connect(
+            os.path.join(CACHE_FOLDER, INDEX_NAME), timeout=30, isolation_level=None
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        _local.connection = connection
+    return connection
+
+
+def _segment_path(segment):
+    return os.path.join(CACHE_FOLDER, f"segment-{segment:05d}.bin")
+
+
+def _read_blob(segment, offset, length):
+    fd = _segment_fds.get(segment)
+    if fd is None:
+        with _fd_lock:
+            fd = _segment_fds.get(segment)
+            if fd is None:
+                fd = os.open(_segment_path(segment), os.O_RDONLY)
+                _segment_fds[segment] = fd
+    return zlib.decompress(os.pread(fd, length, offset))
+
+
+def _close_segments():
+    with _fd_lock:
+        for fd in _segment_fds.values():
+            os.close(fd)
+        _segment_fds.clear()
+
+
+def _touch(endpoint, symph_id, params):
+    with _accessed_lock:
+        _accessed[(endpoint, symph_id, params)] = time.time()
+
+
+def get(endpoint, symph_id, params):
+    """Returns the cached payload bytes, or None."""
+    row = (
+        _connection()
+        .execute(
+            "SELECT b.segment, b.offset, b.length FROM responses r"
+            " JOIN blobs b ON b.digest = r.digest"
+            " WHERE r.endpoint = ? AND r.symph_id = ? AND r.params = ?",
+            (endpoint, symph_id, params),
+        )
+        .fetchone()
+    )
+    if row is None:
+        return None
+    _touch(endpoint, symph_id, params)
+    return _read_blob(*row)
+
+
+def get_many(endpoint, keys):
+    """Batch lookup of (symph_id, params) keys; returns {key: payload} for the hits."""
+    keys = list(dict.fromkeys(keys))
+    found = {}
+    connection = _connection()
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start : start + BATCH_SIZE]
+        values = ", ".join(["(?, ?)"] * len(batch))
+        rows = connection.execute(
+            "SELECT r.symph_id, r.params, b.segment, b.offset, b.length"
+            " FROM responses r JOIN blobs b ON b.digest = r.digest"
+            f" WHERE r.endpoint = ? AND (r.symph_id, r.params) IN (VALUES {values})",
+            [endpoint] + [part for key in batch for part in key],
+        ).fetchall()
+        for symph_id, params, segment, offset, length in rows:
+            _touch(endpoint, symph_id, params)
+            found[(symph_id, params)] = _read_blob(segment, offset, length)
+    return found
+
+
+def put(endpoint, symph_id, params, payload):
+    put_many(endpoint, {(symph_id, params): payload})
+
+
+def put_many(endpoint, items, stored_at=None):
+    """
+    Stores {(symph_id, params): payload bytes} in a single transaction.
+    stored_at optionally maps keys to the time the response was fetched.
+    """
+    now = time.time()
+    stored_at = stored_at or {}
+    with _write_lock:
+        connection = _connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for (symph_id, params), payload in items.items():
+                digest = hashlib.sha256(payload).hexdigest()
+                known = connection.execute(
+                    "SELECT 1 FROM blobs WHERE digest = ?", (digest,)
+                ).fetchone()
+                if known is None:
+                    segment, offset, length = _append_blob(connection, payload)
+                    connection.execute(
+                        "INSERT INTO blobs VALUES (?, ?, ?, ?)",
+                        (digest, segment, offset, length),
+                    )
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        endpoint,
+                        symph_id,
+                        params,
+                        digest,
+                        stored_at.get((symph_id, params), now),
+                        now,
+                    ),
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+
+def _current_segment(connection):
+    """
+    The segment being appended to. Segment numbers only ever go up, so a number
+    compact() retired is never reused while another process still has the old
+    file open.
+    """
+    row = connection.execute(
+        "SELECT value FROM counters WHERE name = 'segment'"
+    ).fetchone()
+    if row is not None:
+        return row[0]
+    # an index written before the counter existed
+    segment = connection.execute("SELECT MAX(segment) FROM blobs").fetchone()[0] or 0
+    _set_current_segment(connection, segment)
+    return segment
+
+
+def _set_current_segment(connection, segment):
+    connection.execute(
+        "INSERT OR REPLACE INTO counters VALUES ('segment', ?)", (segment,)
+    )
+
+
+def _append_blob(connection, payload):
+    # caller holds _write_lock and a write transaction, so the newest segment
+    # has a single writer
+    data = zlib.compress(payload, 1)
+    segment = _current_segment(connection)
+    path = _segment_path(segment)
+    if os.path.exists(path) and os.path.getsize(path) + len(data) > SEGMENT_MAX_BYTES:
+        segment += 1
+        path = _segment_path(segment)
+        _set_current_segment(connection, segment)
+    with open(path, "ab") as file:
+        offset = file.tell()
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    return segment, offset, len(data)
+
+
+def flush_access():
+    """Writes the access times gathered by get/get_many back to the index."""
+    with _accessed_lock:
+        accessed = [(at, *key) for key, at in _accessed.items()]
+        _accessed.clear()
+    if not accessed or not os.path.exists(os.path.join(CACHE_FOLDER, INDEX_NAME)):
+        return
+    with _write_lock:
+        connection = _connection()
+        connection.execute("BEGIN IMMEDIATE")
+        connection.executemany(
+            "UPDATE responses SET accessed_at = MAX(accessed_at, ?)"
+            " WHERE endpoint = ? AND symph_id = ? AND params = ?",
+            accessed,
+        )
+        connection.execute("COMMIT")
+
+
+def entries():
+    """Every indexed response as {(endpoint, symph_id, params): {"size", "stored", "accessed"}}."""
+    if not os.path.exists(os.path.join(CACHE_FOLDER, INDEX_NAME)):
+        return {}
+    flush_access()
+    rows = _connection().execute(
+        "SELECT r.endpoint, r.symph_id, r.params, b.length, r.stored_at, r.accessed_at"
+        " FROM responses r JOIN blobs b ON b.digest = r.digest"
+    )
+    return {
+        (endpoint, symph_id, params): {
+            "size": size,
+            "stored": stored,
+            "accessed": accessed,
+        }
+        for endpoint, symph_id, params, size, stored, accessed in rows
+    }
+
+
+def delete(keys):
+    """Drops index entries; their blobs are reclaimed by the next compact()."""
+    with _write_lock:
+        connection = _connection()
+        connection.execute("BEGIN IMMEDIATE")
+        connection.executemany(
+            "DELETE FROM responses WHERE endpoint = ? AND symph_id = ? AND params = ?",
+            list(keys),
+        )
+        connection.execute("COMMIT")
+
+
+def compact():
+    """Drops unreferenced blobs and rewrites the live ones into fresh segments."""
+    with _write_lock:
+        connection = _connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM responses)"
+            )
+            # past every number used so far, even when the store is empty
+            segment = _current_segment(connection) + 1
+            blobs = connection.execute(
+                "SELECT digest, segment, offset, length FROM blobs"
+                " ORDER BY segment, offset"
+            ).fetchall()
+            out = None
+            sources = {}
+            for digest, old_segment, offset, length in blobs:
+                if old_segment not in sources:
+                    sources[old_segment] = open(_segment_path(old_segment), "rb")
+                source = sources[old_segment]
+                source.seek(offset)
+                data = source.read(length)
+                if out is None or out.tell() + length > SEGMENT_MAX_BYTES:
+                    if out is not None:
+                        out.close()
+                        segment += 1
+                    out = open(_segment_path(segment), "ab")
+                new_offset = out.tell()
+                out.write(data)
+                connection.execute(
+                    "UPDATE blobs SET segment = ?, offset = ? WHERE digest = ?",
+                    (segment, new_offset, digest),
+                )
+            if out is not None:
+                out.flush()
+                os.fsync(out.fileno())
+                out.close()
+            for source in sources.values():
+                source.close()
+            _set_current_segment(connection, segment)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        # every blob now lives in a new segment; drop the old files
+        _close_segments()
+        live = {
+            segment
+            for (segment,) in connection.execute("SELECT DISTINCT segment FROM blobs")
+        }
+        for file_name in os.listdir(CACHE_FOLDER):
+            if file_name.startswith("segment-") and file_name.endswith(".bin"):
+                if int(file_name[len("segment-") : -len(".bin")]) not in live:
+                    os.remove(os.path.join(CACHE_FOLDER, file_name))
+        connection.execute("VACUUM")
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+# trailing 12 months of daily returns for the whole universe, aligned on one day
+# grid; every shorter era is a suffix of it
+MATRIX_WINDOW = 365
+
+
+def build_returns_matrix(curves, start_days, end_day, window=MATRIX_WINDOW):
+    """
+    Aligns the trailing `window` calendar days of every curve on the union of
+    their trading days.
+
+    curves: {id: (days, values)} from the curve store; start_days: {id: first
+    epoch day the symphony counts as having data}. returns[t] is the return from
+    grid day days[t] to days[t + 1]; a curve missing a grid day carries its last
+    close forward (a zero return). Returns before a curve's first close are 0 and
+    only ever land in eras the symphony is not eligible for.
+    """
+    window_start = end_day - window
+    ids = list(curves)
+    grid = np.unique(
+        np.concatenate(
+            [
+                days[(days >= window_start) & (days <= end_day)]
+                for days, _ in curves.values()
+            ]
+            or [np.empty(0, dtype=np.int32)]
+        )
+    ).astype(np.int32)
+
+    levels = np.full((len(grid), len(ids)), np.nan)
+    for j, symph_id in enumerate(ids):
+        levels[:, j] = _levels_on_grid(grid, *curves[symph_id])
+    returns = _returns(levels)
+
+    return {
+        "ids": np.array(ids, dtype=str),
+        "days": grid,
+        "returns": returns,
+        "start_days": np.array([start_days[symph_id] for symph_id in ids], np.int32),
+        "end_day": end_day,
+    }
+
+
+def _levels_on_grid(grid, days, values):
+    """The last close at or before each grid day; NaN before the first close."""
+    last = np.searchsorted(days, grid, side="right") - 1
+    levels = np.full(len(grid), np.nan)
+    levels[last >= 0] = values[last[last >= 0]]
+    return levels
+
+
+def _returns(levels):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = levels[1:] / levels[:-1] - 1
+    returns[~np.isfinite(returns)] = 0
+    return returns
+
+
+def curve_returns(matrix, days, values):
+    """One curve's returns on the matrix grid, aligned as build_returns_matrix does."""
+    return _returns(_levels_on_grid(matrix["days"], days, values))
+
+
+def standardize(returns):
+    """Columns scaled to zero mean and unit norm, so dot products are correlations."""
+    centered = returns - returns.mean(axis=0)
+    norms = np.linalg.norm(centered, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(norms > 0, centered / norms, 0)
+
+
+def era_correlations(matrix, era_days):
+    """
+    Yields (days, correlation DataFrame) for every era length in era_days.
+
+    An era of N days holds the returns whose both closes fall on or after
+    end_day - N, so every era is a suffix of the matrix. The matrix is cut at the
+    era starts into disjoint segments; walking them newest first, each segment's
+    Gram matrix and column sums are added to running totals, and each era's
+    correlation comes out of the totals covering its suffix. That is one pass of
+    X^T X over the 12 months instead of one per era.
+
+    Like the per-era backtests this replaces, a symphony only takes part in the
+    eras that start on or after its first day of data.
+    """
+    ids = matrix["ids"]
+    returns = matrix["returns"]
+    days = matrix["days"]
+    end_day = matrix["end_day"]
+
+    # returns[t] starts on days[t]; the era's suffix starts at its first grid day
+    eras = sorted(era_days)
+    cuts = [int(np.searchsorted(days[:-1], end_day - n)) for n in eras]
+
+    gram = np.zeros((len(ids), len(ids)))
+    sums = np.zeros(len(ids))
+    segment_end = len(returns)
+    for n, cut in zip(eras, cuts):
+        segment = returns[cut:segment_end]
+        gram += segment.T @ segment
+        sums += segment.sum(axis=0)
+        segment_end = cut
+
+        count = len(returns) - cut
+        eligible = matrix["start_days"] <= end_day - n
+        if count < 2:
+            yield n, pd.DataFrame(index=ids[eligible], columns=ids[eligible])
+            continue
+        s = sums[eligible]
+        cov = (gram[np.ix_(eligible, eligible)] - np.outer(s, s) / count) / (count - 1)
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.outer(std, std)
+        corr[~np.isfinite(corr)] = np.nan
+        np.fill_diagonal(corr, np.where(std > 0, 1.0, np.nan))
+        yield n, pd.DataFrame(corr, index=ids[eligible], columns=ids[eligible])
+
+
+def correlation_row(matrix, returns, days):
+    """
+    Correlation of one returns vector (on the matrix grid) with every symphony
+    eligible for the era of `days` days, as a Series indexed by id.
+
+    Computed like era_correlations, over the era's suffix of the matrix, but
+    with vector products against the one series instead of a Gram matrix.
+    """
+    end_day = matrix["end_day"]
+    cut = int(np.searchsorted(matrix["days"][:-1], end_day - days))
+    eligible = matrix["start_days"] <= end_day - days
+    ids = matrix["ids"][eligible]
+    if len(matrix["returns"]) - cut < 2:
+        return pd.Series(np.nan, index=ids)
+
+    # a contiguous suffix view; the eligibility mask is applied to the results
+    segment = matrix["returns"][cut:]
+    # in the matrix's own dtype, so a float32 map is never copied to float64
+    x = (returns[cut:] - returns[cut:].mean()).astype(segment.dtype)
+    centered_dot = x @ segment
+    means = np.ones(len(x), segment.dtype) @ segment / len(x)
+    squares = np.einsum("ij,ij->j", segment, segment)
+    norms = np.sqrt(np.clip(squares - len(x) * means**2, 0, None)) * np.linalg.norm(x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = (centered_dot / norms)[eligible]
+    corr[~np.isfinite(corr)] = np.nan
+    return pd.Series(corr, index=ids)
@@ -0,0 +1,176 @@
+import curve_store
+import numpy as np
+import os
+import pandas as pd
+import time_index
+
+# trailing windows (calendar days) built by the nightly run; any other N can be
+# built on demand with build_rolling_panel
+ROLLING_WINDOWS = [90, 365]
+ROLLING_METRICS = ["return", "drawdown", "sharpe", "vol"]
+ROLLING_FOLDER = "rolling_stats"
+TRADING_DAYS_PER_YEAR = 252
+
+
+def compute_rolling_stats(days, values, window):
+    """
+    Trailing-window stats for every day of one curve in O(T).
+
+    The window ending on days[t] holds the daily returns on days in
+    (days[t] - window, days[t]]. Sums come from cumulative sums of the returns and
+    squared returns; the window high comes from a running max.
+
+    "drawdown" is the drop from the window high to the close on days[t]. The
+    minimum of it over all t is the worst drawdown in any window-sized span.
+
+    Returns a float32 array shaped (len(days), len(ROLLING_METRICS)). Rows whose
+    window reaches back before the first day of the curve are NaN.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full((len(days), len(ROLLING_METRICS)), np.nan, dtype=np.float32)
+    if len(days) < 2:
+        return out
+
+    returns = np.zeros(len(values))
+    returns[1:] = values[1:] / values[:-1] - 1
+    sum_returns = np.cumsum(returns)
+    sum_squares = np.cumsum(returns * returns)
+
+    # index of the last close at or before the window start, i.e. the base capital
+    t = np.arange(len(days))
+    s = np.searchsorted(days, days - window, side="right") - 1
+    valid = s >= 0
+    t, s = t[valid], s[valid]
+    n = t - s
+    valid = n >= 2
+    t, s, n = t[valid], s[valid], n[valid]
+
+    mean = (sum_returns[t] - sum_returns[s]) / n
+    var = (sum_squares[t] - sum_squares[s] - n * mean * mean) / (n - 1)
+    std = np.sqrt(np.clip(var, 0, None))
+
+    # running max over (days[t] - window, days[t]], then fold in the base close
+    window_high = (
+        pd.Series(values, index=time_index.epoch_days_to_index(days))
+        .rolling(f"{window}D")
+        .max()
+        .to_numpy()
+    )
+    peak = np.maximum(window_high[t], values[s])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[t, 0] = values[t] / values[s] - 1
+        out[t, 1] = values[t] / peak - 1
+        out[t, 2] = np.where(
+            std > 0, mean / std * np.sqrt(TRADING_DAYS_PER_YEAR), np.nan
+        )
+        out[t, 3] = std * np.sqrt(TRADING_DAYS_PER_YEAR)
+    return out
+
+
+def build_rolling_panel(symph_ids, window, folder=curve_store.CURVE_FOLDER):
+    """
+    Builds a symphony x date x metric panel from the curve store.
+
+    Series are stored back to back (ragged) so symphonies with short histories do
+    not pay for padding: rows offsets[i]:offsets[i + 1] belong to ids[i].
+    """
+    ids = []
+    all_days = []
+    all_values = []
+    offsets = [0]
+    for symph_id in symph_ids:
+        curve = curve_store.load_curve(symph_id, folder)
+        if curve is None:
+            continue
+        days, values = curve
+        ids.append(symph_id)
+        all_days.append(days.astype(np.int32))
+        all_values.append(compute_rolling_stats(days, values, window))
+        offsets.append(offsets[-1] + len(days))
+
+    return {
+        "ids": np.array(ids, dtype=str),
+        "window": window,
+        "metrics": np.array(ROLLING_METRICS),
+        "offsets": np.array(offsets, dtype=np.int64),
+        "days": (np.concatenate(all_days) if all_days else np.empty(0, dtype=np.int32)),
+        "values": (
+            np.concatenate(all_values)
+            if all_values
+            else np.empty((0, len(ROLLING_METRICS)), dtype=np.float32)
+        ),
+    }
+
+
+def rolling_panel_path(window, folder=ROLLING_FOLDER):
+    return os.path.join(folder, f"rolling_{window}d.npz")
+
+
+def save_rolling_panel(panel, folder=ROLLING_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    np.savez(rolling_panel_path(panel["window"], folder), **panel)
+
+
+def load_rolling_panel(window, folder=ROLLING_FOLDER):
+    path = rolling_panel_path(window, folder)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        panel = {key: data[key] for key in data.files}
+    panel["window"] = int(panel["window"])
+    return panel
+
+
+def available_windows(folder=ROLLING_FOLDER):
+    if not os.path.exists(folder):
+        return []
+    windows = []
+    for file_name in os.listdir(folder):
+        if file_name.startswith("rolling_") and file_name.endswith("d.npz"):
+            windows.append(int(file_name[len("rolling_") : -len("d.npz")]))
+    return sorted(windows)
+
+
+def query_rolling_panel(panel, metric, how="max", since=None, until=None):
+    """
+    Reduces one metric over time for every symphony in the panel.
+
+    e.g. the best Sharpe over any 90-day window since live:
+        query_rolling_panel(panel_90d, "sharpe", "max", since=live_days)
+
+    since/until are epoch days (inclusive) bounding the window itself, so
+    "since" keeps only windows that start on or after it. Either may be a
+    scalar or a {symph_id: epoch_day} mapping. Returns a Series indexed by id.
+    """
+    column = list(panel["metrics"]).index(metric)
+    reducer = {"max": np.nanmax, "min": np.nanmin, "mean": np.nanmean, "last": None}[
+        how
+    ]
+    window = panel["window"]
+    offsets = panel["offsets"]
+
+    results = {}
+    for i, symph_id in enumerate(panel["ids"]):
+        symph_id = str(symph_id)
+        days = panel["days"][offsets[i] : offsets[i + 1]]
+        values = panel["values"][offsets[i] : offsets[i + 1], column]
+
+        keep = np.ones(len(days), dtype=bool)
+        start = since.get(symph_id) if isinstance(since, dict) else since
+        end = until.get(symph_id) if isinstance(until, dict) else until
+        if start is not None and not pd.isna(start):
+            keep &= days - window >= start
+        if end is not None and not pd.isna(end):
+            keep &= days <= end
+        values = values[keep]
+        values = values[~np.isnan(values)]
+
+        if len(values) == 0:
+            results[symph_id] = np.nan
+        elif reducer is None:
+            results[symph_id] = float(values[-1])
+        else:
+            results[symph_id] = float(reducer(values))
+    return pd.Series(results, dtype=np.float64)
@@ -0,0 +1,247 @@
+import collections
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROFILE_FOLDER = "profiles"
+
+_lock = threading.Lock()
+_run_started = time.perf_counter()
+_run_started_at = datetime.datetime.now().isoformat(timespec="seconds")
+_stages = {}
+_requests = {}
+_caches = {}
+_bytes = {"downloaded": 0, "parsed": 0}
+_executors = {}
+
+# opt-in profiling: mode is None, "cprofile" or "sample"; stages empty means all
+_profile_mode = None
+_profile_stages = set()
+
+
+def configure_profiling(mode, stages=None):
+    global _profile_mode, _profile_stages
+    _profile_mode = mode
+    _profile_stages = set(stages or [])
+
+
+def reset():
+    global _run_started, _run_started_at
+    with _lock:
+        _run_started = time.perf_counter()
+        _run_started_at = datetime.datetime.now().isoformat(timespec="seconds")
+        _stages.clear()
+        _requests.clear()
+        _caches.clear()
+        _bytes.update(downloaded=0, parsed=0)
+        _executors.clear()
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Times a pipeline stage, profiling it too when profiling is enabled for it."""
+    profiler = None
+    if _profile_mode and (not _profile_stages or name in _profile_stages):
+        profiler = _start_profiler(name)
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if profiler is not None:
+            profiler()
+        with _lock:
+            entry = _stages.setdefault(name, {"calls": 0, "wall_s": 0.0})
+            entry["calls"] += 1
+            entry["wall_s"] += elapsed
+
+
+def record_request(endpoint, started, response=None, error=None, size=None):
+    """
+    Records one remote call started at time.perf_counter() `started`. Pass the
+    response, or the exception when no response came back at all. A streamed
+    body has no .content left to measure; pass its size instead.
+    """
+    latency = time.perf_counter() - started
+    status = response.status_code if response is not None else type(error).__name__
+    with _lock:
+        entry = _requests.setdefault(
+            endpoint, {"count": 0, "statuses": collections.Counter(), "latencies": []}
+        )
+        entry["count"] += 1
+        entry["statuses"][str(status)] += 1
+        entry["latencies"].append(latency)
+        if size is not None:
+            _bytes["downloaded"] += size
+        elif response is not None:
+            _bytes["downloaded"] += len(response.content)
+
+
+def record_cache(cache, hit):
+    with _lock:
+        entry = _caches.setdefault(cache, {"hit": 0, "miss": 0})
+        entry["hit" if hit else "miss"] += 1
+
+
+def record_parsed(num_bytes):
+    with _lock:
+        _bytes["parsed"] += num_bytes
+
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that reports queue depth, queue wait and worker utilization."""
+
+    def __init__(self, name, max_workers=None, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        self.name = name
+        self._opened = time.perf_counter()
+        with _lock:
+            entry = _executors.setdefault(
+                name,
+                {
+                    "executors": 0,
+                    "workers": 0,
+                    "tasks": 0,
+                    "queued": 0,
+                    "max_queue_depth": 0,
+                    "queue_wait_s": 0.0,
+                    "busy_s": 0.0,
+                    "open_s": 0.0,
+                },
+            )
+            entry["executors"] += 1
+            entry["workers"] = max(entry["workers"], self._max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        submitted = time.perf_counter()
+        with _lock:
+            entry = _executors[self.name]
+            entry["tasks"] += 1
+            entry["queued"] += 1
+            entry["max_queue_depth"] = max(entry["max_queue_depth"], entry["queued"])
+
+        def run():
+            started = time.perf_counter()
+            with _lock:
+                entry["queued"] -= 1
+                entry["queue_wait_s"] += started - submitted
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with _lock:
+                    entry["busy_s"] += time.perf_counter() - started
+
+        return super().submit(run)
+
+    def shutdown(self, wait=True, **kwargs):
+        super().shutdown(wait=wait, **kwargs)
+        with _lock:
+            _executors[self.name]["open_s"] += time.perf_counter() - self._opened
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[
+        min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    ]
+
+
+def summary():
+    with _lock:
+        requests_summary = {}
+        for endpoint, entry in _requests.items():
+            latencies = sorted(entry["latencies"])
+            requests_summary[endpoint] = {
+                "count": entry["count"],
+                "statuses": dict(entry["statuses"]),
+                "latency_ms": {
+                    "mean": 1000 * sum(latencies) / len(latencies),
+                    "p50": 1000 * _percentile(latencies, 0.50),
+                    "p95": 1000 * _percentile(latencies, 0.95),
+                    "max": 1000 * latencies[-1],
+                },
+            }
+
+        caches_summary = {}
+        for cache, entry in _caches.items():
+            lookups = entry["hit"] + entry["miss"]
+            caches_summary[cache] = dict(entry, hit_rate=entry["hit"] / lookups)
+
+        executors_summary = {}
+        for name, entry in _executors.items():
+            capacity = entry["open_s"] * entry["workers"]
+            executors_summary[name] = {
+                key: value for key, value in entry.items() if key != "queued"
+            }
+            executors_summary[name]["utilization"] = (
+                entry["busy_s"] / capacity if capacity else None
+            )
+
+        return {
+            "started_at": _run_started_at,
+            "wall_s": time.perf_counter() - _run_started,
+            "stages": {name: dict(entry) for name, entry in _stages.items()},
+            "requests": requests_summary,
+            "caches": caches_summary,
+            "bytes": dict(_bytes),
+            "executors": executors_summary,
+        }
+
+
+def write_summary(path="run_summary.json"):
+    with open(path, "w") as file:
+        json.dump(summary(), file, indent=2)
+    return path
+
+
+def _start_profiler(name):
+    """Starts a profiler for one stage and returns the function that stops it."""
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    if _profile_mode == "cprofile":
+        # cProfile only sees the calling thread; use "sample" for threaded stages
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def stop():
+            profiler.disable()
+            profiler.dump_stats(os.path.join(PROFILE_FOLDER, f"{name}.prof"))
+
+        return stop
+
+    # sampling profiler: collapsed stacks of every thread, flamegraph.pl format
+    samples = collections.Counter()
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)})"
+                    )
+                    frame = frame.f_back
+                samples[";".join(reversed(stack))] += 1
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    def stop():
+        done.set()
+        sampler.join()
+        with open(os.path.join(PROFILE_FOLDER, f"{name}.folded"), "w") as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+    return stop
@@ -0,0 +1,91 @@
+import collections
+import csv
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# futures kept in flight per worker: enough to keep every worker busy, small
+# enough that memory stays flat no matter how large the universe is
+IN_FLIGHT_PER_WORKER = 2
+
+
+def in_flight_limit(max_workers=None):
+    """
+    The in-flight window for an executor created with max_workers (None meaning
+    ThreadPoolExecutor's default worker count).
+    """
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) + 4)
+    return max_workers * IN_FLIGHT_PER_WORKER
+
+
+def stream_map(executor, fn, items, max_in_flight):
+    """
+    Lazily pulls items and runs fn(item) on the executor, with at most
+    max_in_flight futures pending (see in_flight_limit). Yields (item, future)
+    pairs in completion order; call future.result() to get the value or
+    re-raise the task's exception.
+    """
+    items = iter(items)
+    in_flight = {}
+    for item in itertools.islice(items, max_in_flight):
+        in_flight[executor.submit(fn, item)] = item
+
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            item = in_flight.pop(future)
+            # refill before yielding so workers stay busy while the caller writes
+            for next_item in itertools.islice(items, 1):
+                in_flight[executor.submit(fn, next_item)] = next_item
+            yield item, future
+
+
+def ordered_map(executor, fn, items, max_in_flight):
+    """
+    Like stream_map, but yields (item, future) pairs in the order of items. At
+    most max_in_flight items are running or finished and waiting for an
+    earlier one, so a slow item holds back new work rather than letting
+    finished results pile up behind it.
+    """
+    items = iter(items)
+    window = collections.deque(
+        (item, executor.submit(fn, item))
+        for item in itertools.islice(items, max_in_flight)
+    )
+    while window:
+        item, future = window.popleft()
+        wait([future])
+        for next_item in itertools.islice(items, 1):
+            window.append((next_item, executor.submit(fn, next_item)))
+        yield item, future
+
+
+class CsvRowSink:
+    """
+    Writes rows to `path + ".partial"` as they complete, so partial results can
+    be inspected during a run, and renames it to `path` once the run finishes.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.partial_path = path + ".partial"
+        self.rows_written = 0
+        self._file = open(self.partial_path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns)
+        self._writer.writeheader()
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self._file.flush()
+        self.rows_written += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        # a failed run leaves the .partial file behind for inspection
+        if exc_type is None:
+            os.replace(self.partial_path, self.path)
+        return False
@@ -0,0 +1,203 @@
+import json
+import numpy as np
+import os
+import re
+
+# What the screener needs from a symphony's score (its strategy tree), read in
+# one streaming pass so the document is never held whole:
+#   size       bytes of the score JSON (the old algo_size)
+#   tickers    tickers of the asset nodes
+#   nodes      nodes in the tree (objects with a "step")
+#   depth      levels of the tree, the root being 1
+#   rebalance  the root's rebalance setting, and its corridor width if any
+#
+# The inverted index maps each ticker to the symphonies holding it, so "holds
+# TQQQ" is one lookup instead of a scan over every score. fetch-metadata saves
+# the features it read to FEATURES_PATH (a shard run, next to its output) and
+# build-indexes builds the index from that file, not from the API.
+FEATURES_PATH = "score_features.json"
+TICKER_INDEX_PATH = "ticker_index.npz"
+
+# a key with its colon, a string value, a bracket or a literal; the commas and
+# whitespace before it are skipped with it, so they are never tokens themselves
+_TOKEN = re.compile(
+    rb'[\s,]*(?:"((?:[^"\\]|\\.)*)"\s*(:)?|([{}\[\]])|(-?[0-9][0-9.eE+-]*|true|false|null))'
+)
+_KEYS = {b"step", b"ticker", b"rebalance", b"rebalance-corridor-width"}
+
+
+class ScoreParser:
+    """Feed the score in chunks of bytes, then call close() for its features."""
+
+    def __init__(self):
+        self.size = 0
+        self.tickers = set()
+        self.nodes = 0
+        self.depth = 0
+        self.rebalance = None
+        self.corridor = None
+        self._buffer = b""
+        # per open object its current key; per open array a 1-tuple of the key
+        # it is the value of
+        self._stack = []
+        self._children_depth = 0
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        buffer = self._buffer + chunk
+        position = 0
+        end_of_buffer = len(buffer)
+        stack = self._stack
+        children_depth = self._children_depth
+        match = _TOKEN.match
+        while True:
+            token = match(buffer, position)
+            if token is None:
+                # only an unfinished string or literal may wait for more input
+                rest = buffer[position:].lstrip(b" \t\r\n,")
+                if rest and rest[:1] not in b'"-0123456789tfn':
+                    raise ValueError(f"not a JSON token: {rest[:20]!r}")
+                break
+            string, colon, bracket, literal = token.groups()
+            # a literal, or a string that may be a key, can continue in the next
+            # chunk
+            if token.end() == end_of_buffer and (
+                literal is not None or (string is not None and colon is None)
+            ):
+                break
+            position = token.end()
+
+            if bracket == b"{":
+                stack.append(None)
+            elif bracket == b"[":
+                key = stack[-1] if stack else None
+                stack.append((key,))
+                children_depth += key == b"children"
+            elif bracket is not None:
+                key = stack.pop()
+                children_depth -= key == (b"children",)
+            elif colon is not None:
+                stack[-1] = string
+            elif stack and stack[-1] in _KEYS:
+                self._children_depth = children_depth
+                self._value(stack[-1], string, literal)
+        self._buffer = buffer[position:]
+        self._children_depth = children_depth
+
+    def close(self):
+        token = _TOKEN.match(self._buffer)
+        if token is not None and token.group(4) is not None and self._stack:
+            self._value(self._stack[-1], None, token.group(4))
+        return {
+            "size": self.size,
+            "tickers": sorted(self.tickers),
+            "nodes": self.nodes,
+            "depth": self.depth,
+            "rebalance": self.rebalance,
+            "corridor": self.corridor,
+        }
+
+    def _value(self, key, string, literal):
+        if key == b"step":
+            self.nodes += 1
+            self.depth = max(self.depth, self._children_depth + 1)
+        elif key == b"ticker" and string is not None:
+            self.tickers.add(_decode(string).upper())
+        elif self._children_depth > 0:
+            # rebalance settings belong to the root
+            return
+        elif key == b"rebalance" and string is not None:
+            self.rebalance = _decode(string)
+        elif key == b"rebalance-corridor-width" and literal is not None:
+            self.corridor = float(literal) if literal[:1] in b"-0123456789" else None
+
+
+def _decode(string):
+    if b"\\" not in string:
+        return string.decode("utf-8")
+    return json.loads(b'"' + string + b'"')
+
+
+def parse_score(chunks):
+    parser = ScoreParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def build_ticker_index(features):
+    """
+    features: {id: parse_score result}. Returns the per-symphony columns and,
+    per ticker, the positions of the symphonies holding it (CSR layout).
+    """
+    ids = list(features)
+    postings = {}
+    for position, symph_id in enumerate(ids):
+        for ticker in features[symph_id]["tickers"]:
+            postings.setdefault(ticker, []).append(position)
+    tickers = sorted(postings)
+    lengths = [len(postings[ticker]) for ticker in tickers]
+    return {
+        "ids": np.array(ids, dtype=str),
+        "size": np.array([features[i]["size"] for i in ids], np.int64),
+        "nodes": np.array([features[i]["nodes"] for i in ids], np.int32),
+        "depth": np.array([features[i]["depth"] for i in ids], np.int16),
+        "rebalance": np.array([features[i]["rebalance"] or "" for i in ids], str),
+        "corridor": np.array(
+            [
+                np.nan if features[i]["corridor"] is None else features[i]["corridor"]
+                for i in ids
+            ]
+        ),
+        "tickers": np.array(tickers, dtype=str),
+        "starts": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        "postings": np.array(
+            [p for ticker in tickers for p in postings[ticker]], np.int32
+        ),
+    }
+
+
+def save_features(features, path=FEATURES_PATH):
+    with open(path + ".tmp", "w") as file:
+        json.dump(features, file)
+    os.replace(path + ".tmp", path)
+
+
+def load_features(path=FEATURES_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_ticker_index(index, path=TICKER_INDEX_PATH):
+    np.savez(path + ".tmp.npz", **index)
+    os.replace(path + ".tmp.npz", path)
+
+
+def load_ticker_index(path=TICKER_INDEX_PATH):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def holding(index, tickers, every=True):
+    """Ids of the symphonies holding every (or, every=False, any) of tickers."""
+    found = None
+    for ticker in tickers:
+        slot = np.searchsorted(index["tickers"], ticker.upper())
+        positions = np.empty(0, np.int32)
+        if slot < len(index["tickers"]) and index["tickers"][slot] == ticker.upper():
+            positions = index["postings"][
+                index["starts"][slot] : index["starts"][slot + 1]
+            ]
+        if found is None:
+            found = positions
+        elif every:
+            found = np.intersect1d(found, positions)
+        else:
+            found = np.union1d(found, positions)
+    if found is None:
+        return index["ids"]
+    return index["ids"][found]
@@ -1,10 +1,22 @@
+import clone_groups
 import numpy as np
+import os
 import pandas as pd
+import rolling_stats
+import score_features
+import snapshot_store
 import streamlit as st
+import strategy_clusters
+import tearsheet_batch
+import tempfile
+import time_index
 import uuid
 from st_aggrid import AgGrid, GridOptionsBuilder
 from tearsheet import generate_12mo_plot
 
+# cluster_controls' choices of rows per strategy family
+CLUSTER_ROWS = ["Every symphony", "Its representative", "Best by the sort metric"]
+
 
 def log_scale_slider(label, start, end, key=None):
     """
@@ -104,6 +116,199 @@ def create_custom_df_column(unique_id):
     return f"{selected_category}_{selected_era}_{selected_interval}"
 
 
+@st.cache_resource
+def load_rolling_panel(window):
+    return rolling_stats.load_rolling_panel(window)
+
+
+def add_rolling_stat_column(df):
+    """
+    Lets the user add one column reduced from a precomputed rolling-window panel,
+    e.g. the best Sharpe over any 90-day window since live.
+    """
+    windows = rolling_stats.available_windows()
+    if not windows or not st.checkbox("Add a rolling-window stat"):
+        return df, None
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        window = st.selectbox("Window (days):", windows, key="rolling_window")
+    with col2:
+        metric = st.selectbox(
+            "Metric:", rolling_stats.ROLLING_METRICS, key="rolling_metric"
+        )
+    with col3:
+        how = st.selectbox(
+            "Over time:", ["max", "min", "mean", "last"], key="rolling_how"
+        )
+    with col4:
+        since_live = st.checkbox("Only windows since live", key="rolling_since_live")
+
+    since = None
+    if since_live:
+        since = dict(
+            zip(df["id"], time_index.dates_to_epoch_days(df["algo_live_date"]))
+        )
+    values = rolling_stats.query_rolling_panel(
+        load_rolling_panel(window), metric, how, since=since
+    )
+
+    column = f"Rolling{window}d_{metric}_{how}" + ("_SinceLive" if since_live else "")
+    df = df.copy()
+    df[column] = df["id"].map(values)
+    return df, column
+
+
+@st.cache_data
+def load_clone_groups():
+    return clone_groups.load_clone_groups()
+
+
+def collapse_clones(df):
+    """
+    Optionally keeps one row per group of near-identical symphonies (the
+    representative picked by the nightly run) and adds the group's size.
+    """
+    groups = load_clone_groups()
+    if groups is None or not st.checkbox("Collapse clones to one representative"):
+        return df
+    df = df.merge(groups[["id", "clone_of", "group_size"]], on="id", how="left")
+    # rows whose representative is not in the table stay visible
+    keep = (
+        df["clone_of"].isna()
+        | (df["id"] == df["clone_of"])
+        | ~df["clone_of"].isin(df["id"])
+    )
+    return df[keep].drop(columns="clone_of")
+
+
+@st.cache_resource
+def load_ticker_index():
+    return score_features.load_ticker_index()
+
+
+def filter_by_score(df):
+    """
+    Optionally keeps the symphonies holding given tickers and within a range of
+    complexity, both answered by the nightly ticker index.
+    """
+    index = load_ticker_index()
+    if index is None:
+        return df
+    text = st.text_input("Holds tickers (comma-separated, e.g. TQQQ, BIL):")
+    tickers = [ticker.strip() for ticker in text.split(",") if ticker.strip()]
+    if tickers:
+        every = st.checkbox("Holds all of them (otherwise any)", value=True)
+        df = df[df["id"].isin(score_features.holding(index, tickers, every))]
+
+    most_nodes = int(index["nodes"].max(initial=0))
+    if most_nodes > 1:
+        low, high = st.slider(
+            "Complexity (nodes in the strategy tree):",
+            1,
+            most_nodes,
+            (1, most_nodes),
+        )
+        if (low, high) != (1, most_nodes):
+            in_range = (index["nodes"] >= low) & (index["nodes"] <= high)
+            df = df[df["id"].isin(index["ids"][in_range])]
+    return df
+
+
+@st.cache_data
+def load_strategy_clusters():
+    return strategy_clusters.load_clusters()
+
+
+def cluster_controls(df):
+    """
+    Optionally narrows the table to chosen strategy families (the nightly
+    clustering) and picks how many rows each family shows. Returns the table
+    and that choice, which is applied after sorting.
+    """
+    clusters = load_strategy_clusters()
+    if clusters is None:
+        return df, CLUSTER_ROWS[0]
+    df = df.drop(columns=strategy_clusters.OUTPUT_COLUMNS, errors="ignore").merge(
+        clusters, on="id", how="left"
+    )
+
+    sizes = clusters.drop_duplicates("cluster_id").set_index("cluster_id")
+    families = sizes.index[sizes["cluster_size"] > 1]
+    chosen = st.multiselect(
+        "Only these strategy families:",
+        families,
+        format_func=lambda cluster: (
+            f"{cluster} ({sizes.at[cluster, 'cluster_size']} symphonies)"
+        ),
+    )
+    if chosen:
+        df = df[df["cluster_id"].isin(chosen)]
+    return df, st.radio("Per strategy family, show:", CLUSTER_ROWS, horizontal=True)
+
+
+def one_per_cluster(sorted_df, rows):
+    """Applies cluster_controls' choice to the sorted table."""
+    if rows == CLUSTER_ROWS[1]:
+        keep = sorted_df["cluster_representative"] == sorted_df["id"]
+    elif rows == CLUSTER_ROWS[2]:
+        keep = ~sorted_df["cluster_id"].duplicated()
+    else:
+        return sorted_df
+    # symphonies the clustering has not seen yet stay visible
+    return sorted_df[keep | sorted_df["cluster_id"].isna()]
+
+
+@st.cache_data
+def load_symphony_history(symph_id, column, latest_snapshot):
+    # latest_snapshot only keys the cache, so a new night's run is picked up
+    return snapshot_store.symphony_history(symph_id, [column])
+
+
+def show_history(symph_id, column):
+    """The sort column's value for symph_id in every stored nightly snapshot."""
+    dates = snapshot_store.snapshot_dates()
+    if len(dates) < 2:
+        return
+    history = load_symphony_history(symph_id, column, dates[-1])
+    values = pd.to_numeric(history[column], errors="coerce").dropna()
+    if values.empty:
+        return
+    st.write(f"## 5. {column} over the nightly runs:")
+    st.line_chart(values)
+
+
+def batch_tearsheets(sorted_df):
+    """Tearsheets of the top rows of the current screen, as one zip download."""
+    top = st.number_input(
+        "Tearsheets for the top results:",
+        min_value=1,
+        max_value=max(len(sorted_df), 1),
+        value=min(tearsheet_batch.BATCH_TOP, max(len(sorted_df), 1)),
+    )
+    live_only = st.checkbox("Only LIVE data", key="batch_live_only")
+    if not st.button("Generate tearsheets") or sorted_df.empty:
+        return
+    zip_path = os.path.join(tempfile.gettempdir(), f"tearsheets_{uuid.uuid4()}.zip")
+    with st.spinner(f"Generating {top} tearsheets..."):
+        failed = tearsheet_batch.generate_tearsheets(
+            sorted_df["id"].head(top).tolist(), zip_path, live_only
+        )
+    try:
+        with open(zip_path, "rb") as file:
+            zip_data = file.read()
+    finally:
+        os.remove(zip_path)
+    if failed:
+        st.write(f"{len(failed)} of them are incomplete; see errors.txt in the zip.")
+    st.download_button(
+        label="Download tearsheets (zip)",
+        data=zip_data,
+        file_name=tearsheet_batch.ZIP_PATH,
+        mime="application/zip",
+    )
+
+
 ## PAGE STREAMLIT START ##
 def simple_screener_page():
     # Load the DataFrame at the very start
@@ -126,6 +331,22 @@ def simple_screener_page():
     # Initialize a variable to hold the filtered DataFrame
     filtered_df = df.copy()
 
+    filtered_df = collapse_clones(filtered_df)
+    filtered_df, cluster_rows = cluster_controls(filtered_df)
+    filtered_df = filter_by_score(filtered_df)
+    filtered_df, rolling_column = add_rolling_stat_column(filtered_df)
+    if rolling_column is not None and filtered_df[rolling_column].notna().any():
+        selected_range = log_scale_slider(
+            label=f"Select a range of values for {rolling_column}",
+            start=filtered_df[rolling_column].min(),
+            end=filtered_df[rolling_column].max(),
+            key="slider_rolling",
+        )
+        filtered_df = filtered_df[
+            (filtered_df[rolling_column] >= selected_range[0])
+            & (filtered_df[rolling_column] <= selected_range[1])
+        ]
+
     # Display existing filters and collect their selected ranges and df_columns
     for unique_id in st.session_state.filter_ids:
         # Display and collect the custom df_column selection
@@ -173,6 +394,7 @@ def simple_screener_page():
 
     # Reset the index of the DataFrame and then display it without the index column
     sorted_df = filtered_df.sort_values(by=custom_df_column, ascending=False)
+    sorted_df = one_per_cluster(sorted_df, cluster_rows)
 
     # Configure the grid options
     gb = GridOptionsBuilder.from_dataframe(sorted_df.reset_index(drop=True))
@@ -182,6 +404,7 @@ def simple_screener_page():
 
     # Display the table with AgGrid using the configured options
     response = AgGrid(sorted_df.reset_index(drop=True), gridOptions=gridOptions)
+    batch_tearsheets(sorted_df)
     selected_row = response["selected_rows"]
     print(selected_row)
     if selected_row:
@@ -193,3 +416,4 @@ def simple_screener_page():
         )
         st.write(f"## 4. Return for prior 12 months ({selected_symphony_id}):")
         generate_12mo_plot(selected_symphony_id)
+        show_history(selected_symphony_id, custom_df_column)
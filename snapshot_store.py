@@ -0,0 +1,309 @@
+import argparse
+import numpy as np
+import os
+import pandas as pd
+
+# Every run's output table, kept as a chain of deltas: snapshots/<date>.npz
+# holds only the cells that differ from the previous run's table, so storage
+# grows with how much the stats change, not with how many runs there were.
+#
+# A delta is columnar: the ids, columns and strings seen for the first time
+# (appended to the dictionaries of the runs before it), which rows appeared or
+# disappeared, and the changed cells as (row, column, value) arrays. Every cell
+# is a float64; a text column (e.g. the dates) holds indexes into the strings.
+# A numeric column that later gets text (e.g. one that was all empty on its
+# first run) is re-typed: the delta clears it and stores its cells again as
+# text, so earlier snapshots still read back as numbers.
+# Reading a date replays the deltas up to it with vectorized assignments, into
+# arrays that grow by doubling rather than once per run.
+SNAPSHOT_FOLDER = "snapshots"
+KEY = "id"
+
+
+def snapshot_dates(folder=SNAPSHOT_FOLDER):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(
+        name[:-4]
+        for name in os.listdir(folder)
+        if name.endswith(".npz") and not name.endswith(".tmp.npz")
+    )
+
+
+def _empty_state():
+    return {
+        "ids": [],
+        "columns": [],
+        "text": [],
+        "strings": [],
+        "values": np.empty((0, 0)),
+        "present": np.zeros(0, dtype=bool),
+        "column_present": np.zeros(0, dtype=bool),
+    }
+
+
+def _load_delta(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def _retyped(delta):
+    # deltas written before columns could be re-typed have none
+    return delta.get("retyped", np.empty(0, np.int64))
+
+
+def _grow(array, shape, fill):
+    """array, or a copy at least twice as large on every axis it must outgrow."""
+    if all(size <= capacity for size, capacity in zip(shape, array.shape)):
+        return array
+    grown = np.full(
+        [
+            max(size, 2 * capacity) if size > capacity else capacity
+            for size, capacity in zip(shape, array.shape)
+        ],
+        fill,
+        dtype=array.dtype,
+    )
+    grown[tuple(slice(0, capacity) for capacity in array.shape)] = array
+    return grown
+
+
+def _apply(state, delta):
+    """Applies delta in place; the arrays may end up larger than the state."""
+    state["ids"].extend(delta["new_ids"].tolist())
+    state["columns"].extend(delta["new_columns"].tolist())
+    state["text"].extend(delta["new_text"].tolist())
+    state["strings"].extend(delta["new_strings"].tolist())
+    shape = len(state["ids"]), len(state["columns"])
+
+    values = state["values"] = _grow(state["values"], shape, np.nan)
+    present = state["present"] = _grow(state["present"], shape[:1], False)
+    column_present = state["column_present"] = _grow(
+        state["column_present"], shape[1:], False
+    )
+    for j in _retyped(delta):
+        values[:, j] = np.nan
+        state["text"][j] = True
+    values[delta["rows"], delta["cols"]] = delta["values"]
+    present[delta["added"]] = True
+    present[delta["removed"]] = False
+    column_present[delta["added_columns"]] = True
+    column_present[delta["removed_columns"]] = False
+    return state
+
+
+def _replay(dates, folder=SNAPSHOT_FOLDER):
+    state = _empty_state()
+    for date in dates:
+        state = _apply(state, _load_delta(os.path.join(folder, date + ".npz")))
+    # views of just the state's part of the arrays
+    rows, columns = len(state["ids"]), len(state["columns"])
+    state["values"] = state["values"][:rows, :columns]
+    state["present"] = state["present"][:rows]
+    state["column_present"] = state["column_present"][:columns]
+    return state
+
+
+def _has_text(cells):
+    """Whether any cell is neither empty nor a number."""
+    if pd.api.types.is_numeric_dtype(cells):
+        return False
+    cells = cells.dropna()
+    return bool(pd.to_numeric(cells, errors="coerce").isna().any())
+
+
+def _diff(state, table):
+    """The delta taking state to table (a DataFrame with a KEY column)."""
+    positions = {symph_id: i for i, symph_id in enumerate(state["ids"])}
+    columns = {column: j for j, column in enumerate(state["columns"])}
+    strings = {string: k for k, string in enumerate(state["strings"])}
+    new_ids = [i for i in table[KEY].astype(str) if i not in positions]
+    for symph_id in new_ids:
+        positions[symph_id] = len(positions)
+    new_columns = [c for c in table.columns if c != KEY and c not in columns]
+    new_text = [not pd.api.types.is_numeric_dtype(table[c]) for c in new_columns]
+    for column in new_columns:
+        columns[column] = len(columns)
+    text = dict(zip(state["columns"], state["text"])) | dict(zip(new_columns, new_text))
+    retyped = [
+        column
+        for column in state["columns"]
+        if column in table and not text[column] and _has_text(table[column])
+    ]
+    for column in retyped:
+        text[column] = True
+
+    new_strings = []
+    rows = np.array([positions[i] for i in table[KEY].astype(str)], dtype=np.int64)
+    changed_rows, changed_cols, changed_values = [], [], []
+    for column in columns:
+        if column not in table:
+            # a dropped column: its cells go back to empty
+            new = np.full(len(rows), np.nan)
+        elif text[column]:
+            cells = table[column]
+            for string in cells.dropna().astype(str).unique():
+                if string not in strings:
+                    strings[string] = len(strings)
+                    new_strings.append(string)
+            new = cells.map(lambda cell: strings[str(cell)], na_action="ignore")
+            new = new.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            new = pd.to_numeric(table[column], errors="coerce").to_numpy(np.float64)
+        j = columns[column]
+        old = np.full(len(rows), np.nan)
+        # a re-typed column is cleared before its new cells are applied
+        if j < state["values"].shape[1] and column not in retyped:
+            known = rows < state["values"].shape[0]
+            old[known] = state["values"][rows[known], j]
+        changed = ~((old == new) | (np.isnan(old) & np.isnan(new)))
+        changed_rows.append(rows[changed])
+        changed_cols.append(np.full(changed.sum(), j, dtype=np.int64))
+        changed_values.append(new[changed])
+
+    now_present = np.zeros(len(positions), dtype=bool)
+    now_present[rows] = True
+    was_present = np.zeros(len(positions), dtype=bool)
+    was_present[: len(state["present"])] = state["present"]
+    column_now = np.array([column in table for column in columns], dtype=bool)
+    column_was = np.zeros(len(columns), dtype=bool)
+    column_was[: len(state["column_present"])] = state["column_present"]
+    return {
+        "new_ids": np.array(new_ids, dtype=str),
+        "new_columns": np.array(new_columns, dtype=str),
+        "new_text": np.array(new_text, dtype=bool),
+        "new_strings": np.array(new_strings, dtype=str),
+        "retyped": np.array([columns[column] for column in retyped], dtype=np.int64),
+        "rows": np.concatenate(changed_rows or [np.empty(0, np.int64)]),
+        "cols": np.concatenate(changed_cols or [np.empty(0, np.int64)]),
+        "values": np.concatenate(changed_values or [np.empty(0)]),
+        "added": np.flatnonzero(now_present & ~was_present),
+        "removed": np.flatnonzero(was_present & ~now_present),
+        "added_columns": np.flatnonzero(column_now & ~column_was),
+        "removed_columns": np.flatnonzero(column_was & ~column_now),
+    }
+
+
+def append_snapshot(table, date, folder=SNAPSHOT_FOLDER):
+    """
+    Stores table as the snapshot of date (YYYY-MM-DD), replacing one already
+    taken that day. Returns the number of changed cells stored.
+    """
+    dates = snapshot_dates(folder)
+    if dates and dates[-1] > date:
+        raise ValueError(f"snapshot {date} is older than the latest, {dates[-1]}")
+    delta = _diff(_replay([d for d in dates if d < date], folder), table)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, date + ".npz")
+    np.savez_compressed(path + ".tmp.npz", **delta)
+    os.replace(path + ".tmp.npz", path)
+    return len(delta["values"])
+
+
+def _decode(state, values, columns):
+    """Turns text columns' string indexes back into strings."""
+    frame = pd.DataFrame(values, columns=columns)
+    strings = np.array(state["strings"] + [None], dtype=object)
+    for column, is_text in zip(state["columns"], state["text"]):
+        if is_text and column in frame:
+            codes = frame[column].to_numpy()
+            codes = np.where(np.isnan(codes), len(strings) - 1, codes).astype(int)
+            frame[column] = strings[codes]
+    return frame
+
+
+def read_snapshot(date=None, folder=SNAPSHOT_FOLDER):
+    """The table as of the latest snapshot on or before date (default: latest)."""
+    dates = [d for d in snapshot_dates(folder) if date is None or d <= date]
+    if not dates:
+        return None
+    state = _replay(dates, folder)
+    frame = _decode(state, state["values"][state["present"]], state["columns"])
+    frame = frame.loc[:, state["column_present"]]
+    frame.insert(0, KEY, np.array(state["ids"], dtype=object)[state["present"]])
+    return frame
+
+
+def symphony_history(symph_id, columns=None, folder=SNAPSHOT_FOLDER):
+    """
+    One row per snapshot in which symph_id was present, indexed by date, with
+    its values of `columns` (default: all) as of that run. Only symph_id's row
+    is replayed, so this reads each delta once without rebuilding the table.
+    """
+    position = None
+    id_count = 0
+    names, text, strings = [], [], []
+    row = np.empty(0)
+    present = False
+    dates, rows = [], []
+    for date in snapshot_dates(folder):
+        delta = _load_delta(os.path.join(folder, date + ".npz"))
+        if position is None and symph_id in delta["new_ids"]:
+            position = id_count + delta["new_ids"].tolist().index(symph_id)
+        id_count += len(delta["new_ids"])
+        names.extend(delta["new_columns"].tolist())
+        text.extend(delta["new_text"].tolist())
+        strings.extend(delta["new_strings"].tolist())
+        row = np.concatenate([row, np.full(len(delta["new_columns"]), np.nan)])
+        for j in _retyped(delta):
+            row[j] = np.nan
+            text[j] = True
+        if position is None:
+            continue
+
+        mine = delta["rows"] == position
+        row[delta["cols"][mine]] = delta["values"][mine]
+        if position in delta["added"]:
+            present = True
+        elif position in delta["removed"]:
+            present = False
+        if present:
+            # decoded with this run's column types
+            dates.append(date)
+            rows.append(
+                [
+                    (
+                        (None if np.isnan(value) else strings[int(value)])
+                        if is_text
+                        else value
+                    )
+                    for value, is_text in zip(row, text)
+                ]
+            )
+    # columns first seen in later runs were empty in earlier ones
+    frame = pd.DataFrame(
+        [values + [np.nan] * (len(names) - len(values)) for values in rows],
+        index=pd.Index(dates, name="date"),
+        columns=names,
+    )
+    return frame if columns is None else frame.reindex(columns=columns)
+
+
+def storage_bytes(folder=SNAPSHOT_FOLDER):
+    return sum(
+        os.path.getsize(os.path.join(folder, date + ".npz"))
+        for date in snapshot_dates(folder)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshots of the stats table")
+    parser.add_argument("command", choices=["list", "read", "history"])
+    parser.add_argument("--date", help="read: as of this date (default: latest)")
+    parser.add_argument("--id", help="history: the symphony")
+    parser.add_argument("--columns", nargs="*", help="history: only these columns")
+    parser.add_argument("--output", help="read: write the table to this csv")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for date in snapshot_dates():
+            print(date, os.path.getsize(os.path.join(SNAPSHOT_FOLDER, date + ".npz")))
+        print(f"{storage_bytes()} bytes in total")
+    elif args.command == "read":
+        table = read_snapshot(args.date)
+        if args.output:
+            table.to_csv(args.output, index=False)
+        else:
+            print(table.to_string())
+    else:
+        print(symphony_history(args.id, args.columns).to_string())
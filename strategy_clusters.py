@@ -0,0 +1,142 @@
+import numpy as np
+import os
+import pandas as pd
+import returns_matrix
+
+# Strategy families: single-linkage clustering on 1 - correlation of the
+# trailing 12 months of daily returns.
+#
+# Single linkage only ever merges along a minimum spanning tree, and the MST of
+# a correlation space is (nearly) contained in its k-nearest-neighbour graph. So
+# each symphony's NEIGHBORS most correlated peers are found in row blocks of
+# BLOCK_ROWS x N float32 correlations, never a dense N x N matrix, and Kruskal
+# over those edges yields the linkage. Cutting it where correlation drops below
+# CLUSTER_MIN_CORR gives the cluster ids. Groups with no neighbour links between
+# them are never merged, so the linkage can be a forest of fewer than N-1 rows.
+CLUSTERS_PATH = "strategy_clusters.csv"
+LINKAGE_PATH = "strategy_linkage.csv"
+NEIGHBORS = 15
+BLOCK_ROWS = 1024
+CLUSTER_MIN_CORR = 0.85
+# columns merged into output.csv
+OUTPUT_COLUMNS = ["cluster_id", "cluster_size"]
+
+
+def nearest_neighbors(returns, neighbors=NEIGHBORS, block_rows=BLOCK_ROWS):
+    """(neighbor positions, correlations), both symphonies x neighbors."""
+    unit = returns_matrix.standardize(np.asarray(returns, dtype=np.float32))
+    unit = unit.astype(np.float32)
+    n = unit.shape[1]
+    neighbors = min(neighbors, n - 1)
+    positions = np.empty((n, neighbors), np.int32)
+    correlations = np.empty((n, neighbors), np.float32)
+    for start in range(0, n, block_rows):
+        rows = np.arange(start, min(start + block_rows, n))
+        block = unit[:, rows].T @ unit
+        block[np.arange(len(rows)), rows] = -np.inf
+        best = np.argpartition(-block, neighbors - 1, axis=1)[:, :neighbors]
+        positions[rows] = best
+        correlations[rows] = np.take_along_axis(block, best, axis=1)
+    return positions, correlations
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def single_linkage(n, left, right, distance, cut_distance):
+    """
+    Kruskal over the edges, in increasing distance. Returns (linkage, labels):
+    linkage rows are [node, node, distance, size] as in scipy, with leaves
+    0..n-1 and the t-th merge creating node n + t; labels are the roots of the
+    components joined by edges no longer than cut_distance.
+    """
+    parent = np.arange(n)
+    node = np.arange(n)
+    size = np.ones(n, dtype=np.int64)
+    linkage = []
+    labels = None
+    for k in np.argsort(distance, kind="stable"):
+        if labels is None and distance[k] > cut_distance:
+            labels = np.array([_find(parent, i) for i in range(n)])
+        root_i, root_j = _find(parent, left[k]), _find(parent, right[k])
+        if root_i == root_j:
+            continue
+        linkage.append(
+            [node[root_i], node[root_j], distance[k], size[root_i] + size[root_j]]
+        )
+        root, child = min(root_i, root_j), max(root_i, root_j)
+        parent[child] = root
+        size[root] += size[child]
+        node[root] = n + len(linkage) - 1
+    if labels is None:
+        labels = np.array([_find(parent, i) for i in range(n)])
+    return np.array(linkage, dtype=np.float64).reshape(-1, 4), labels
+
+
+def cluster_universe(ids, returns, min_corr=CLUSTER_MIN_CORR):
+    """
+    Clusters the columns of a (days x symphonies) returns matrix. Returns
+    (clusters, linkage): one row per id with its cluster_id (0 is the largest
+    cluster), cluster_size and the cluster's representative -- the member most
+    correlated with its in-cluster neighbours -- and the linkage as a DataFrame.
+    """
+    n = len(ids)
+    positions, correlations = nearest_neighbors(returns)
+    left = np.repeat(np.arange(n), positions.shape[1])
+    right = positions.ravel()
+    # one edge per pair, however many of the two listed the other
+    pairs = np.unique(
+        np.stack([np.minimum(left, right), np.maximum(left, right)], axis=1),
+        axis=0,
+        return_index=True,
+    )[1]
+    left, right = left[pairs], right[pairs]
+    corr = correlations.ravel()[pairs].astype(np.float64)
+    linkage, roots = single_linkage(n, left, right, 1 - corr, 1 - min_corr)
+
+    # number clusters by size, largest first, then by their first member
+    _, first, inverse, sizes = np.unique(
+        roots, return_index=True, return_inverse=True, return_counts=True
+    )
+    order = np.lexsort((first, -sizes))
+    cluster_ids = np.empty(len(order), dtype=np.int64)
+    cluster_ids[order] = np.arange(len(order))
+    labels = cluster_ids[inverse]
+
+    inside = labels[left] == labels[right]
+    centrality = np.zeros(n)
+    np.add.at(centrality, left[inside], corr[inside])
+    np.add.at(centrality, right[inside], corr[inside])
+    by_centrality = np.lexsort((np.arange(n), -centrality, labels))
+    # the first of each cluster's run, indexed by cluster id
+    representative = by_centrality[
+        np.unique(labels[by_centrality], return_index=True)[1]
+    ]
+
+    clusters = pd.DataFrame(
+        {
+            "id": ids,
+            "cluster_id": labels,
+            "cluster_size": sizes[inverse],
+            "cluster_representative": np.asarray(ids)[representative[labels]],
+        }
+    )
+    linkage = pd.DataFrame(linkage, columns=["left", "right", "distance", "size"])
+    linkage = linkage.astype({"left": int, "right": int, "size": int})
+    return clusters, linkage
+
+
+def save_clusters(clusters, linkage, path=CLUSTERS_PATH, linkage_path=LINKAGE_PATH):
+    for frame, file_path in [(clusters, path), (linkage, linkage_path)]:
+        frame.to_csv(file_path + ".tmp", index=False)
+        os.replace(file_path + ".tmp", file_path)
+
+
+def load_clusters(path=CLUSTERS_PATH):
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path)
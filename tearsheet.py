@@ -1,18 +1,25 @@
 import datetime
+import fetch_service
+import io
 import os
 import pandas as pd
-import quantstats as qs
-import requests
 import streamlit as st
 import time
-from download_curves import single_backtest, epoch_days_to_date
-from pyhtml2pdf import converter
+from curve_store import curve_from_dvm_capital
+from time_index import epoch_days_to_index
+
+# download_curves (and with it requests and the pipeline modules) is imported in
+# the functions that fetch, so pages importing this module for the plot helper
+# do not load it at app start.
 
 ONLY_LIVE = "Only LIVE data"
 ALL_DATA = "All data (before and after LIVE)"
 
 
 def single_tearsheet():
+    import requests
+    from download_curves import single_backtest
+
     option1 = st.selectbox("Select Time Range:", (ONLY_LIVE, ALL_DATA))
 
     def get_live_start_date(symphony_id, max_retries=3, retry_delay=2):
@@ -59,16 +66,9 @@ def single_tearsheet():
 
     def calculate_returns_from_dvm_capital(dvm_capital):
         try:
-            dvm_capital = dict(sorted(dvm_capital.items()))
-            dvm_capital = {
-                epoch_days_to_date(int(k)): v for k, v in dvm_capital.items()
-            }
-            returns = pd.Series(dvm_capital).pct_change().dropna()
-
-            # Convert the index to DatetimeIndex if it's not already
-            returns.index = pd.to_datetime(returns.index)
-
-            return returns
+            days, values = curve_from_dvm_capital(dvm_capital)
+            returns = pd.Series(values, index=epoch_days_to_index(days))
+            return returns.pct_change().dropna()
         except Exception as e:
             print(
                 f"An unexpected error occurred in calculate_returns_from_dvm_capital: {e}"
@@ -97,6 +97,9 @@ def single_tearsheet():
     # if the button is clicked, then do the following
 
     if symphony_id_button:
+        # quantstats takes seconds to import; only pay for it once a sheet is asked for
+        import quantstats as qs
+
         # if the symphony id is not empty
         if symphony_id != "":
             if option1 == ONLY_LIVE:
@@ -114,6 +117,7 @@ def single_tearsheet():
                         live_start_date,
                         datetime.date.today(),
                         use_stored=False,
+                        priority=fetch_service.INTERACTIVE,
                     )
                     returns = calculate_returns_from_dvm_capital(
                         backtest["dvm_capital"][symphony_id]
@@ -157,7 +161,11 @@ def single_tearsheet():
                 start_date = datetime.datetime(1990, 1, 1).strftime("%Y-%m-%d")
                 # get the symphony data
                 backtest = single_backtest(
-                    symphony_id, start_date, datetime.date.today(), use_stored=False
+                    symphony_id,
+                    start_date,
+                    datetime.date.today(),
+                    use_stored=False,
+                    priority=fetch_service.INTERACTIVE,
                 )
                 returns = calculate_returns_from_dvm_capital(
                     backtest["dvm_capital"][symphony_id]
@@ -202,31 +210,44 @@ def single_tearsheet():
             st.write("Symphony ID is empty")
 
 
-def plot_timeseries_streamlit(returns, title="12mo Returns", lw=1.5, figsize=(6, 4)):
+@st.cache_data(max_entries=512, show_spinner=False)
+def render_12mo_plot(selected_symphony_id, market_day):
+    """
+    Renders the prior-12-month returns plot to PNG bytes.
+
+    market_day is part of the cache key, so a plot is only re-rendered once a new
+    trading day lands in the curve store. Raises LookupError when the curve
+    cannot be fetched, so the failure is not cached along with the plots.
+    """
+    import matplotlib.pyplot as plt
+    import quantstats as qs
+    from download_curves import get_full_curve
+
+    curve = get_full_curve(selected_symphony_id, priority=fetch_service.INTERACTIVE)
+    if curve is None:
+        raise LookupError(f"no curve for {selected_symphony_id}")
+    days, values = curve
+
+    # slice the trailing year straight out of the full-history curve
+    in_window = days >= market_day - 365
+    returns = pd.Series(values[in_window], index=epoch_days_to_index(days[in_window]))
+    returns = returns.pct_change().fillna(0)
     returns = qs.utils._prepare_returns(returns)
+
     return_plot = qs.plots.returns(returns, show=False)
-    st.pyplot(return_plot)
+    buffer = io.BytesIO()
+    return_plot.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(return_plot)
+    return buffer.getvalue()
 
 
 def generate_12mo_plot(selected_symphony_id):
-    today = datetime.date.today()
-    result = single_backtest(
-        selected_symphony_id, today - datetime.timedelta(days=365), today
-    )
-    print(result)
-    if result is not None:
-        result = dict(sorted(result["dvm_capital"][str(selected_symphony_id)].items()))
-        dvm_capital_keys = list(result.keys())
-        dvm_capital_values = list(result.values())
-
-        dvm_capital_series = pd.Series(dvm_capital_values)
-        dvm_capital_pct_change = dvm_capital_series.pct_change().fillna(0)
-
-        dates = [epoch_days_to_date(int(d)) for d in dvm_capital_keys]
-        dvm_capital_pct_change.index = dates
-        returns = pd.DataFrame(dvm_capital_pct_change, index=dates, columns=["returns"])
-        returns.index = pd.to_datetime(returns.index)
-
-        plot_timeseries_streamlit(
-            returns["returns"], title="Returns", lw=1.5, figsize=(10, 6)
-        )
+    from download_curves import latest_market_day_int
+
+    market_day = int(latest_market_day_int())
+    try:
+        plot_png = render_12mo_plot(str(selected_symphony_id), market_day)
+    except LookupError:
+        st.write("No returns available for this symphony right now; try again later")
+        return
+    st.image(plot_png)
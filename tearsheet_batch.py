@@ -0,0 +1,226 @@
+import argparse
+import base64
+import concurrent.futures
+import curve_store
+import fetch_service
+import multiprocessing
+import os
+import pandas as pd
+import shutil
+import tempfile
+import time_index
+import zipfile
+from multiprocessing import util
+
+# Quantstats tearsheets (HTML and PDF) for a list of symphonies, e.g. the top
+# of a screen, packed into one zip.
+#
+# The curves are brought up to date first, on the fetch threads, so they are in
+# the curve store before any sheet is rendered. The sheets are then rendered in
+# a pool of processes, one per core. Each worker imports quantstats once and
+# keeps one headless Chrome for all its PDFs, instead of one browser launch per
+# sheet as pyhtml2pdf's converter does.
+#
+# The screener page imports this module at app start for its defaults, so the
+# pipeline modules (download_curves, run_metrics, scheduler) are imported by
+# the functions that use them.
+BATCH_TOP = 50
+ZIP_PATH = "tearsheets.zip"
+# Chrome's print settings, as pyhtml2pdf uses them
+PDF_OPTIONS = {
+    "landscape": False,
+    "displayHeaderFooter": False,
+    "printBackground": True,
+    "preferCSSPageSize": True,
+}
+
+# per worker process: its browser, or why it has none
+_browser = None
+_browser_error = None
+
+
+def fetch_inputs(ids, live_only=False, priority=fetch_service.BATCH):
+    """
+    {id: first epoch day of its sheet (None for the whole history)} for the ids
+    whose curves are in the curve store, fetching stale ones.
+    """
+    import download_curves
+    import run_metrics
+    import scheduler
+
+    day_from = {}
+
+    def fetch(symph_id):
+        if download_curves.get_full_curve(symph_id, priority=priority) is None:
+            return False
+        start_day = None
+        if live_only:
+            live_start_date = download_curves.get_live_start_date(
+                symph_id, priority=priority
+            )
+            if live_start_date is None:
+                return False
+            start_day = time_index.date_to_epoch_day(live_start_date)
+        day_from[symph_id] = start_day
+        return True
+
+    with run_metrics.InstrumentedExecutor(
+        "tearsheet_curves", download_curves.max_workers
+    ) as executor:
+        for symph_id, future in scheduler.stream_map(
+            executor, fetch, ids, scheduler.in_flight_limit(download_curves.max_workers)
+        ):
+            if not future.result():
+                download_curves.v_print(f"No curve for {symph_id}; no tearsheet")
+    return day_from
+
+
+def _start_worker():
+    global _browser, _browser_error
+    import matplotlib
+
+    matplotlib.use("Agg")
+    # the seconds of import are paid once per worker, not per sheet
+    import quantstats  # noqa: F401
+
+    try:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        options = Options()
+        for argument in [
+            "--headless",
+            "--disable-gpu",
+            "--no-sandbox",
+            "--disable-dev-shm-usage",
+        ]:
+            options.add_argument(argument)
+        _browser = webdriver.Chrome(options=options)
+    except Exception as e:
+        # the HTML sheets are still worth having
+        _browser_error = f"no browser for PDFs: {e}"
+        return
+    util.Finalize(_browser, _browser.quit, exitpriority=10)
+
+
+def render_tearsheet(
+    symph_id, start_day, folder, curve_folder=curve_store.CURVE_FOLDER
+):
+    """
+    Writes symph_id's HTML and PDF sheets into folder, in a worker process.
+    Returns (their paths, the PDF's being None if it failed, and that error).
+    """
+    import quantstats as qs
+
+    days, values = curve_store.load_curve(symph_id, curve_folder)
+    if start_day is not None:
+        in_range = days >= start_day
+        days, values = days[in_range], values[in_range]
+    returns = pd.Series(values, index=time_index.epoch_days_to_index(days))
+    returns = returns.pct_change().dropna()
+
+    html_path = os.path.join(folder, f"{symph_id}_tearsheet.html")
+    qs.reports.html(returns, output=html_path, title=f"{symph_id} Tearsheet")
+    if _browser is None:
+        return html_path, None, _browser_error
+
+    pdf_path = os.path.join(folder, f"{symph_id}_tearsheet.pdf")
+    try:
+        _browser.get("file://" + os.path.abspath(html_path))
+        result = _browser.execute_cdp_cmd("Page.printToPDF", PDF_OPTIONS)
+        with open(pdf_path, "wb") as file:
+            file.write(base64.b64decode(result["data"]))
+    except Exception as e:
+        return html_path, None, f"PDF failed: {e}"
+    return html_path, pdf_path, None
+
+
+def generate_tearsheets(ids, zip_path=ZIP_PATH, live_only=False, processes=None):
+    """
+    Tearsheets of ids into zip_path, in the order given. Returns {id: reason}
+    for the ids that are missing (or have only the HTML sheet) in the zip;
+    those are also listed in its errors.txt.
+    """
+    import download_curves
+    import run_metrics
+
+    ids = list(dict.fromkeys(ids))
+    failed = {}
+    with run_metrics.stage("tearsheets"):
+        day_from = fetch_inputs(ids, live_only, priority=fetch_service.INTERACTIVE)
+        for symph_id in ids:
+            if symph_id not in day_from:
+                failed[symph_id] = "no curve" + (" or live date" if live_only else "")
+
+        folder = tempfile.mkdtemp(prefix="tearsheets_")
+        sheets = {}
+        try:
+            if day_from:
+                # spawned, not forked: the caller may be a threaded dashboard
+                with concurrent.futures.ProcessPoolExecutor(
+                    min(processes or os.cpu_count() or 1, len(day_from)),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_start_worker,
+                ) as pool:
+                    futures = {
+                        pool.submit(render_tearsheet, symph_id, start, folder): symph_id
+                        for symph_id, start in day_from.items()
+                    }
+                    for future in concurrent.futures.as_completed(futures):
+                        symph_id = futures[future]
+                        try:
+                            html_path, pdf_path, error = future.result()
+                        except Exception as e:
+                            failed[symph_id] = f"tearsheet failed: {e}"
+                            continue
+                        sheets[symph_id] = [html_path, pdf_path]
+                        if error is not None:
+                            failed[symph_id] = error
+
+            with zipfile.ZipFile(
+                zip_path + ".tmp", "w", compression=zipfile.ZIP_DEFLATED
+            ) as archive:
+                for symph_id in ids:
+                    for path in sheets.get(symph_id, []):
+                        if path is not None:
+                            archive.write(path, os.path.basename(path))
+                failed = {i: failed[i] for i in ids if i in failed}
+                if failed:
+                    archive.writestr(
+                        "errors.txt",
+                        "".join(f"{i}\t{reason}\n" for i, reason in failed.items()),
+                    )
+            os.replace(zip_path + ".tmp", zip_path)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+    download_curves.v_print(
+        f"{len(sheets)} of {len(ids)} tearsheets written to {zip_path}"
+    )
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tearsheets for many symphonies")
+    parser.add_argument("ids", nargs="*", help="symphony ids")
+    parser.add_argument(
+        "--from-table",
+        help="take the ids from this csv (e.g. output.csv), sorted by --sort",
+    )
+    parser.add_argument("--sort", help="--from-table: column to sort by, descending")
+    parser.add_argument("--top", type=int, default=BATCH_TOP)
+    parser.add_argument("--live-only", action="store_true", help="only LIVE data")
+    parser.add_argument("--processes", type=int, help="default: one per core")
+    parser.add_argument("--output", default=ZIP_PATH)
+    args = parser.parse_args()
+
+    ids = list(args.ids)
+    if args.from_table:
+        table = pd.read_csv(args.from_table)
+        if args.sort:
+            table = table.sort_values(args.sort, ascending=False)
+        ids += table["id"].tolist()
+    failed = generate_tearsheets(
+        ids[: args.top], args.output, args.live_only, args.processes
+    )
+    for symph_id, reason in failed.items():
+        print(symph_id, reason)
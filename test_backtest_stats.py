@@ -0,0 +1,150 @@
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest_stats
+import curve_store
+import response_cache
+import time_index
+
+SYMPH_ID = "sym1"
+# (start, end) windows as download_curves requests them; some bounds fall on
+# weekends, so the slice starts or ends on the nearest close inside
+WINDOWS = [
+    ("1990-01-01", "2024-06-28"),
+    ("2023-01-01", "2024-01-01"),
+    ("2024-03-02", "2024-04-01"),
+    ("2024-05-01", "2024-06-28"),
+]
+
+
+def composer_stats(days, values):
+    """Composer's conventions, spelled out independently of compute_stats."""
+    curve = pd.Series(values, index=time_index.epoch_days_to_index(days))
+    returns = curve.pct_change().dropna()
+    cumulative = curve.iloc[-1] / curve.iloc[0] - 1
+    years = (curve.index[-1] - curve.index[0]).days / 365
+    annualized = (1 + cumulative) ** (1 / years) - 1
+    drawdown = (1 - curve / curve.cummax()).max()
+    std = returns.std(ddof=1)
+    return {
+        "cumulative_return": cumulative,
+        "annualized_rate_of_return": annualized,
+        "max_drawdown": drawdown,
+        "calmar_ratio": annualized / drawdown,
+        "sharpe_ratio": returns.mean() / std * np.sqrt(252),
+        "max": returns.max(),
+        "min": returns.min(),
+        "mean": returns.mean(),
+        "standard_deviation": std * np.sqrt(252),
+    }
+
+
+def full_curve():
+    dates = pd.bdate_range("2022-01-03", "2024-06-28")
+    rng = np.random.default_rng(7)
+    values = 10000 * np.cumprod(1 + rng.normal(0.0005, 0.01, len(dates)))
+    return time_index.dates_to_epoch_days(dates), values
+
+
+def window_slice(days, values, start_date, end_date):
+    start_day = time_index.date_to_epoch_day(start_date)
+    end_day = time_index.date_to_epoch_day(end_date)
+    in_window = (days >= start_day) & (days <= end_day)
+    return days[in_window], values[in_window]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """An empty response cache and curve store in tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(response_cache, "_local", threading.local())
+    monkeypatch.setattr(response_cache, "_segment_fds", {})
+    monkeypatch.setattr(response_cache, "_accessed", {})
+    yield
+    response_cache._close_segments()
+
+
+def store_windows(days, values, stats_of=composer_stats):
+    curve_store.save_curve(SYMPH_ID, days, values)
+    response_cache.put_many(
+        "backtest",
+        {
+            (SYMPH_ID, f"{start}:{end}"): json.dumps(
+                {"stats": stats_of(*window_slice(days, values, start, end))}
+            ).encode()
+            for start, end in WINDOWS
+        },
+    )
+
+
+def test_compute_stats_matches_composer_conventions():
+    days, values = full_curve()
+    local = backtest_stats.compute_stats(days, values)
+    for key, expected in composer_stats(days, values).items():
+        assert local[key] == pytest.approx(expected, rel=1e-12), key
+
+
+def test_compute_stats_leaves_out_undefined_ratios():
+    days = np.arange(19000, 19005, dtype=np.int32)
+    flat = backtest_stats.compute_stats(days, np.full(5, 100.0))
+    assert "sharpe_ratio" not in flat and "calmar_ratio" not in flat
+    assert backtest_stats.compute_stats(days[:1], np.ones(1)) == {}
+
+
+@pytest.mark.parametrize("start_date, end_date", WINDOWS)
+def test_window_stats_matches_the_window_alone(start_date, end_date):
+    days, values = full_curve()
+    local = backtest_stats.window_stats(
+        days,
+        values,
+        time_index.date_to_epoch_day(start_date),
+        time_index.date_to_epoch_day(end_date),
+    )
+    expected = composer_stats(*window_slice(days, values, start_date, end_date))
+    for key, value in expected.items():
+        assert local[key] == pytest.approx(value, rel=1e-12), key
+
+
+def test_parity_checks_window_stats_of_the_stored_curve(cache):
+    store_windows(*full_curve())
+    report = backtest_stats.parity()
+    assert report["responses"] == len(WINDOWS)
+    assert report["no_curve"] == 0
+    assert backtest_stats.parity_ok(report)
+    for entry in report["stats"].values():
+        assert entry["compared"] == len(WINDOWS)
+
+
+def test_parity_reports_a_mismatch(cache):
+    def off_by_a_bit(days, values):
+        stats = composer_stats(days, values)
+        if days[0] == time_index.date_to_epoch_day("2024-03-04"):
+            stats["sharpe_ratio"] *= 1.001
+        return stats
+
+    store_windows(*full_curve(), stats_of=off_by_a_bit)
+    report = backtest_stats.parity()
+    assert not backtest_stats.parity_ok(report)
+    sharpe = report["stats"]["sharpe_ratio"]
+    assert sharpe["matched"] == len(WINDOWS) - 1
+    assert sharpe["worst"] == f"{SYMPH_ID} 2024-03-02:2024-04-01"
+
+
+def test_parity_uses_the_stored_curve_not_the_response(cache):
+    days, values = full_curve()
+    store_windows(days, values)
+    # a repaired or refetched curve that no longer matches the cached windows
+    curve_store.save_curve(SYMPH_ID, days, values * np.linspace(1, 1.1, len(days)))
+    assert not backtest_stats.parity_ok(backtest_stats.parity())
+
+
+def test_parity_skips_symphonies_without_a_stored_curve(cache):
+    store_windows(*full_curve())
+    response_cache.put("backtest", "other", "2024-01-02:2024-02-01", b"{}")
+    report = backtest_stats.parity()
+    assert report["no_curve"] == 1
+    assert report["responses"] == len(WINDOWS)
@@ -0,0 +1,35 @@
+import datetime
+import numpy as np
+import pandas as pd
+
+# Composer keys every curve by "epoch days": whole days since 1970-01-01 (UTC)
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+def epoch_day_to_date(day) -> datetime.date:
+    return EPOCH_DATE + datetime.timedelta(days=int(day))
+
+
+def date_to_epoch_day(value) -> int:
+    """Accepts a date, datetime, Timestamp, datetime64 or "YYYY-MM-DD" string."""
+    if isinstance(value, str):
+        value = value[:10]
+    return int(np.datetime64(value, "D").astype(np.int64))
+
+
+def today_epoch_day() -> int:
+    return date_to_epoch_day(datetime.date.today())
+
+
+def epoch_days_to_datetime64(days):
+    """Converts a whole array of epoch days to datetime64[D] in one operation."""
+    return np.asarray(days, dtype=np.int32).astype("datetime64[D]")
+
+
+def epoch_days_to_index(days):
+    return pd.DatetimeIndex(epoch_days_to_datetime64(days))
+
+
+def dates_to_epoch_days(dates):
+    """Inverse of epoch_days_to_datetime64 for an array-like of dates or date strings."""
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int32)